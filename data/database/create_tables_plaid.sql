@@ -9,7 +9,8 @@ CREATE TABLE plaid_access_tokens (
     bank_name VARCHAR(255) NOT NULL, -- Name of the bank
     bank_id VARCHAR(255), -- Plaid bank identifier
     products VARCHAR(255), -- Products associated with the token
-    accounts VARCHAR(255) -- Accounts associated with the token
+    accounts VARCHAR(255), -- Accounts associated with the token
+    transactions_cursor TEXT -- Last applied /transactions/sync cursor for the item
 );
 
 # plaid_accounts
@@ -35,8 +36,24 @@ CREATE TABLE file_import_tracker (
     id INT AUTO_INCREMENT PRIMARY KEY, -- Unique identifier for the import record
     file_name VARCHAR(255) NOT NULL, -- Name of the imported file
     description TEXT, -- Description of the import
+    status VARCHAR(20) NOT NULL DEFAULT 'complete', -- 'in_progress' while a chunked import is running, then 'complete'
+    records_committed INT NOT NULL DEFAULT 0, -- Checkpoint: records of the file committed so far
+    content_hash CHAR(64), -- BLAKE2b hash of the file's content
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- Timestamp when the record was created
-    INDEX (file_name) -- Index on the file_name column
+    INDEX (file_name), -- Index on the file_name column
+    INDEX (content_hash) -- Index on the content_hash column
+);
+
+# import_quarantine
+CREATE TABLE import_quarantine (
+    id INT AUTO_INCREMENT PRIMARY KEY, -- Unique identifier for the quarantined record
+    file_import_id INT, -- Identifier for the associated file import
+    file_name VARCHAR(255) NOT NULL, -- Name of the file the record came from
+    record_index INT NOT NULL, -- Position of the record in the file
+    record LONGTEXT, -- The record as JSON
+    error TEXT, -- Why the record could not be imported
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- Timestamp when the record was quarantined
+    FOREIGN KEY (file_import_id) REFERENCES file_import_tracker(id) ON DELETE CASCADE -- Foreign key constraint
 );
 
 # plaid_liabilities_credit
@@ -113,11 +130,14 @@ CREATE TABLE plaid_transactions (
     payment_meta_reason VARCHAR(255), -- Reason for the payment
     website VARCHAR(255), -- Website of the merchant
     check_number VARCHAR(255), -- Check number, if applicable
+    row_hash CHAR(32), -- MD5 of the transaction and its counterparties, used to skip unchanged rows
     file_import_id INT, -- Identifier for the associated file import
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- Timestamp when the record was created
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP, -- Timestamp when the record was last updated
     INDEX (transaction_id), -- Index on the transaction_id column
     INDEX (account_id), -- Index on the account_id column
+    INDEX (pending_transaction_id), -- Finds the pending row a posted transaction replaces
+    INDEX (pending, date), -- Finds stale pending rows for compaction
     FOREIGN KEY (file_import_id) REFERENCES file_import_tracker(id) ON DELETE CASCADE -- Foreign key constraint
 );
 
@@ -132,6 +152,7 @@ CREATE TABLE plaid_transaction_counterparties (
     confidence_level VARCHAR(50), -- Confidence level of the counterparty data
     entity_id VARCHAR(255), -- Identifier for the counterparty entity
     phone_number VARCHAR(50), -- Phone number of the counterparty
+    row_hash CHAR(32), -- MD5 of the counterparty fields
     file_import_id INT, -- Identifier for the associated file import
     FOREIGN KEY (file_import_id) REFERENCES file_import_tracker(id) ON DELETE CASCADE, -- Foreign key constraint
     FOREIGN KEY (transaction_id) REFERENCES plaid_transactions(transaction_id) ON DELETE CASCADE -- Foreign key constraint
@@ -210,6 +231,7 @@ CREATE TABLE plaid_transactions_history (
     payment_meta_reason VARCHAR(255), -- Reason for the payment
     website VARCHAR(255), -- Website of the merchant
     check_number VARCHAR(255), -- Check number, if applicable
+    row_hash CHAR(32), -- MD5 of the transaction and its counterparties, used to skip unchanged rows
     file_import_id INT, -- Identifier for the associated file import
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- Timestamp when the record was created
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP, -- Timestamp when the record was last updated
@@ -229,6 +251,7 @@ CREATE TABLE plaid_transaction_counterparties_history (
     confidence_level VARCHAR(50), -- Confidence level of the counterparty data
     entity_id VARCHAR(255), -- Identifier for the counterparty entity
     phone_number VARCHAR(50), -- Phone number of the counterparty
+    row_hash CHAR(32), -- MD5 of the counterparty fields
     file_import_id INT, -- Identifier for the associated file import
     FOREIGN KEY (file_import_id) REFERENCES file_import_tracker(id) ON DELETE CASCADE -- Foreign key constraint
 );
@@ -1,5 +1,7 @@
 USE plaid;
 
+DROP VIEW IF EXISTS plaid_transaction_versions;
+
 DROP TABLE IF EXISTS inflow_transactions;
 DROP TABLE IF EXISTS outflow_transactions;
 DROP TABLE IF EXISTS inflow_streams;
@@ -10,9 +12,11 @@ DROP TABLE IF EXISTS plaid_liabilities_credit;
 DROP TABLE IF EXISTS plaid_transaction_counterparties;
 DROP TABLE IF EXISTS plaid_transactions;
 DROP TABLE IF EXISTS plaid_transaction_counterparties_history;
+DROP TABLE IF EXISTS counterparties;
 DROP TABLE IF EXISTS plaid_transactions_history;
 DROP TABLE IF EXISTS plaid_liabilities_credit_apr_history;
 DROP TABLE IF EXISTS plaid_liabilities_credit_history;
+DROP TABLE IF EXISTS import_quarantine;
 DROP TABLE IF EXISTS file_import_tracker;
 DROP TABLE IF EXISTS plaid_accounts;
 DROP TABLE IF EXISTS plaid_access_tokens;
@@ -22,3 +26,6 @@ DROP TABLE IF EXISTS asset_transaction;
 DROP TABLE IF EXISTS asset_item;
 DROP TABLE IF EXISTS asset_account;
 DROP TABLE IF EXISTS asset_report;
+
+# Forget the applied migrations, so utils/migrate.py rebuilds the schema after create_tables_plaid.sql
+DROP TABLE IF EXISTS schema_migrations;
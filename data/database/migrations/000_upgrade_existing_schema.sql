@@ -0,0 +1,94 @@
+# Schema changes made before versioned migrations existed, for databases created from an older
+# create_tables_plaid.sql. Databases created from the current file already have all of them.
+# Each change is applied only when it is missing: MySQL has no ADD COLUMN IF NOT EXISTS, so the
+# statement is chosen from information_schema and run as a prepared statement ('DO 0' does nothing).
+# This runs before 001; on a database that applied 001 and later before this file existed, it
+# finds every change in place and does nothing.
+
+# /transactions/sync cursor per item
+SET @ddl = IF(EXISTS (SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'plaid_access_tokens' AND COLUMN_NAME = 'transactions_cursor'),
+    'DO 0',
+    'ALTER TABLE plaid_access_tokens ADD COLUMN transactions_cursor TEXT');
+PREPARE ddl FROM @ddl;
+EXECUTE ddl;
+DEALLOCATE PREPARE ddl;
+
+# Row hashes for skipping unchanged transactions
+SET @ddl = IF(EXISTS (SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'plaid_transactions' AND COLUMN_NAME = 'row_hash'),
+    'DO 0',
+    'ALTER TABLE plaid_transactions ADD COLUMN row_hash CHAR(32) AFTER check_number');
+PREPARE ddl FROM @ddl;
+EXECUTE ddl;
+DEALLOCATE PREPARE ddl;
+
+SET @ddl = IF(EXISTS (SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'plaid_transactions_history' AND COLUMN_NAME = 'row_hash'),
+    'DO 0',
+    'ALTER TABLE plaid_transactions_history ADD COLUMN row_hash CHAR(32) AFTER check_number');
+PREPARE ddl FROM @ddl;
+EXECUTE ddl;
+DEALLOCATE PREPARE ddl;
+
+SET @ddl = IF(EXISTS (SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'plaid_transaction_counterparties' AND COLUMN_NAME = 'row_hash'),
+    'DO 0',
+    'ALTER TABLE plaid_transaction_counterparties ADD COLUMN row_hash CHAR(32) AFTER phone_number');
+PREPARE ddl FROM @ddl;
+EXECUTE ddl;
+DEALLOCATE PREPARE ddl;
+
+SET @ddl = IF(EXISTS (SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'plaid_transaction_counterparties_history' AND COLUMN_NAME = 'row_hash'),
+    'DO 0',
+    'ALTER TABLE plaid_transaction_counterparties_history ADD COLUMN row_hash CHAR(32) AFTER phone_number');
+PREPARE ddl FROM @ddl;
+EXECUTE ddl;
+DEALLOCATE PREPARE ddl;
+
+# Chunked, resumable imports
+SET @ddl = IF(EXISTS (SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'file_import_tracker' AND COLUMN_NAME = 'status'),
+    'DO 0',
+    'ALTER TABLE file_import_tracker ADD COLUMN status VARCHAR(20) NOT NULL DEFAULT ''complete'' AFTER description, ADD COLUMN records_committed INT NOT NULL DEFAULT 0 AFTER status');
+PREPARE ddl FROM @ddl;
+EXECUTE ddl;
+DEALLOCATE PREPARE ddl;
+
+CREATE TABLE IF NOT EXISTS import_quarantine (
+    id INT AUTO_INCREMENT PRIMARY KEY, -- Unique identifier for the quarantined record
+    file_import_id INT, -- Identifier for the associated file import
+    file_name VARCHAR(255) NOT NULL, -- Name of the file the record came from
+    record_index INT NOT NULL, -- Position of the record in the file
+    record LONGTEXT, -- The record as JSON
+    error TEXT, -- Why the record could not be imported
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- Timestamp when the record was quarantined
+    FOREIGN KEY (file_import_id) REFERENCES file_import_tracker(id) ON DELETE CASCADE -- Foreign key constraint
+);
+
+# Content hashes for the import ledger
+SET @ddl = IF(EXISTS (SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'file_import_tracker' AND COLUMN_NAME = 'content_hash'),
+    'DO 0',
+    'ALTER TABLE file_import_tracker ADD COLUMN content_hash CHAR(64) AFTER records_committed, ADD INDEX (content_hash)');
+PREPARE ddl FROM @ddl;
+EXECUTE ddl;
+DEALLOCATE PREPARE ddl;
+
+# Pending to posted reconciliation
+SET @ddl = IF(EXISTS (SELECT 1 FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'plaid_transactions' AND COLUMN_NAME = 'pending_transaction_id' AND SEQ_IN_INDEX = 1),
+    'DO 0',
+    'ALTER TABLE plaid_transactions ADD INDEX (pending_transaction_id)');
+PREPARE ddl FROM @ddl;
+EXECUTE ddl;
+DEALLOCATE PREPARE ddl;
+
+SET @ddl = IF(EXISTS (SELECT 1 FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'plaid_transactions' AND COLUMN_NAME = 'pending' AND SEQ_IN_INDEX = 1),
+    'DO 0',
+    'ALTER TABLE plaid_transactions ADD INDEX (pending, date)');
+PREPARE ddl FROM @ddl;
+EXECUTE ddl;
+DEALLOCATE PREPARE ddl;
@@ -0,0 +1,17 @@
+# Covering indexes for reads by account or category over a date range.
+# amount is included so spend totals are answered from the index alone.
+# The composite indexes start with account_id, so the single-column account_id indexes are dropped.
+ALTER TABLE plaid_transactions
+    DROP INDEX account_id,
+    ADD INDEX account_date (account_id, date, amount),
+    ADD INDEX category_date (personal_finance_category_primary, date, amount);
+
+ALTER TABLE plaid_transactions_history
+    DROP INDEX account_id,
+    ADD INDEX account_date (account_id, date, amount);
+
+# A file is imported at most once, and the import ledger reads only complete imports
+ALTER TABLE file_import_tracker
+    DROP INDEX file_name,
+    ADD UNIQUE INDEX file_name (file_name),
+    ADD INDEX status_file (status, file_name, content_hash);
@@ -0,0 +1,38 @@
+# Range partitioning of the history tables by archive month (created_at), so versions older than
+# the retention horizon are removed with DROP PARTITION. utils/compact_history.py splits the
+# catch-all pmax partition into monthly partitions and drops the expired ones.
+# MySQL does not partition tables that have foreign keys, and every unique key must include the
+# partitioning column: the file_import_tracker foreign keys are dropped and the primary keys
+# become (id, created_at). The live tables keep their foreign keys and are not partitioned.
+
+ALTER TABLE plaid_transactions_history DROP FOREIGN KEY plaid_transactions_history_ibfk_1;
+
+ALTER TABLE plaid_transactions_history
+    MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, created_at);
+
+ALTER TABLE plaid_transactions_history
+    PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) (
+        PARTITION pmax VALUES LESS THAN MAXVALUE
+    );
+
+# Counterparty versions had no archive time; existing rows take the time of their transaction's version
+ALTER TABLE plaid_transaction_counterparties_history DROP FOREIGN KEY plaid_transaction_counterparties_history_ibfk_1;
+
+ALTER TABLE plaid_transaction_counterparties_history
+    ADD COLUMN created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ADD INDEX transaction_version (transaction_id, file_import_id);
+
+UPDATE plaid_transaction_counterparties_history c
+JOIN plaid_transactions_history h ON h.transaction_id = c.transaction_id AND h.file_import_id = c.file_import_id
+SET c.created_at = h.created_at;
+
+ALTER TABLE plaid_transaction_counterparties_history
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, created_at);
+
+ALTER TABLE plaid_transaction_counterparties_history
+    PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) (
+        PARTITION pmax VALUES LESS THAN MAXVALUE
+    );
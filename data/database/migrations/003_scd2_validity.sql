@@ -0,0 +1,76 @@
+# Validity ranges for slowly-changing-dimension (SCD2) versioning. A live row is current from
+# valid_from; a history row was current from valid_from until valid_to. The importers fill both in
+# either HISTORY_MODE, so "what did this look like at time T" is answered by
+#   SELECT * FROM plaid_transaction_versions WHERE account_id = ? AND valid_from <= T AND valid_to > T
+# Existing live rows start at created_at, when they were last re-inserted. Existing history rows end
+# when they were archived and start when the previous version was archived; the first known version
+# of each row has no recorded start and gets 1970-01-01.
+
+ALTER TABLE plaid_transactions
+    ADD COLUMN valid_from DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ADD INDEX account_valid_from (account_id, valid_from);
+
+UPDATE plaid_transactions SET valid_from = created_at WHERE created_at IS NOT NULL;
+
+ALTER TABLE plaid_transactions_history
+    ADD COLUMN valid_from DATETIME NOT NULL DEFAULT '1970-01-01 00:00:01',
+    ADD COLUMN valid_to DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ADD INDEX transaction_validity (transaction_id, valid_to, valid_from),
+    ADD INDEX account_validity (account_id, valid_to, valid_from);
+
+UPDATE plaid_transactions_history h
+JOIN (
+    SELECT id, created_at, LAG(created_at) OVER (PARTITION BY transaction_id ORDER BY id) AS previous_archived
+    FROM plaid_transactions_history
+) versions ON versions.id = h.id AND versions.created_at = h.created_at
+SET h.valid_to = h.created_at,
+    h.valid_from = COALESCE(versions.previous_archived, '1970-01-01 00:00:01');
+
+# The liabilities history tables recorded no archive time, so their existing rows keep the defaults
+ALTER TABLE plaid_liabilities_credit
+    ADD COLUMN valid_from DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+ALTER TABLE plaid_liabilities_credit_apr
+    ADD COLUMN valid_from DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+ALTER TABLE plaid_liabilities_credit_history
+    ADD COLUMN valid_from DATETIME NOT NULL DEFAULT '1970-01-01 00:00:01',
+    ADD COLUMN valid_to DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ADD INDEX account_validity (account_id, valid_to, valid_from);
+
+ALTER TABLE plaid_liabilities_credit_apr_history
+    ADD COLUMN valid_from DATETIME NOT NULL DEFAULT '1970-01-01 00:00:01',
+    ADD COLUMN valid_to DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ADD INDEX account_validity (account_id, valid_to, valid_from);
+
+# Every version of every transaction, current ones with an open-ended valid_to
+CREATE OR REPLACE VIEW plaid_transaction_versions AS
+SELECT
+    account_id, transaction_id, account_owner, amount, authorized_date, authorized_datetime, date,
+    datetime, iso_currency_code, logo_url, merchant_entity_id, merchant_name, name,
+    payment_channel, pending, pending_transaction_id, transaction_code, transaction_type,
+    unofficial_currency_code, category, category_id, personal_finance_category_confidence_level,
+    personal_finance_category_detailed, personal_finance_category_primary,
+    personal_finance_category_icon_url, location_address, location_city, location_region,
+    location_postal_code, location_country, location_lat, location_lon, location_store_number,
+    payment_meta_reference_number, payment_meta_ppd_id, payment_meta_payee,
+    payment_meta_by_order_of, payment_meta_payer, payment_meta_payment_method,
+    payment_meta_payment_processor, payment_meta_reason, website, check_number, row_hash,
+    file_import_id,
+    valid_from, CAST('9999-12-31 23:59:59' AS DATETIME) AS valid_to
+FROM plaid_transactions
+UNION ALL
+SELECT
+    account_id, transaction_id, account_owner, amount, authorized_date, authorized_datetime, date,
+    datetime, iso_currency_code, logo_url, merchant_entity_id, merchant_name, name,
+    payment_channel, pending, pending_transaction_id, transaction_code, transaction_type,
+    unofficial_currency_code, category, category_id, personal_finance_category_confidence_level,
+    personal_finance_category_detailed, personal_finance_category_primary,
+    personal_finance_category_icon_url, location_address, location_city, location_region,
+    location_postal_code, location_country, location_lat, location_lon, location_store_number,
+    payment_meta_reference_number, payment_meta_ppd_id, payment_meta_payee,
+    payment_meta_by_order_of, payment_meta_payer, payment_meta_payment_method,
+    payment_meta_payment_processor, payment_meta_reason, website, check_number, row_hash,
+    file_import_id,
+    valid_from, valid_to
+FROM plaid_transactions_history;
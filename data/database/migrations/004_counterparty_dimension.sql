@@ -0,0 +1,76 @@
+# Counterparty dimension. The same merchant appears on thousands of transactions, and every link
+# repeated its name, website, logo URL and phone number. Each counterparty is now stored once in
+# counterparties, keyed by an MD5 of its entity_id (or of its name and type when Plaid sends no
+# entity_id), and plaid_transaction_counterparties and its history keep only the link: transaction,
+# counterparty_key and the per-transaction confidence_level. The key is derived from the data, so
+# the importer computes it without a lookup (importers/insert_transactions.py counterparty_key).
+# A counterparty's attributes are the latest ones imported; older versions are not kept.
+
+CREATE TABLE counterparties (
+    counterparty_key CHAR(32) PRIMARY KEY, -- MD5 of 'entity:<entity_id>', or of 'name:<lowercase name>|<type>'
+    entity_id VARCHAR(255), -- Identifier for the counterparty entity
+    name VARCHAR(255), -- Name of the counterparty
+    type VARCHAR(50), -- Type of counterparty (e.g., 'merchant')
+    website VARCHAR(255), -- Website of the counterparty
+    logo_url VARCHAR(255), -- URL of the counterparty's logo
+    phone_number VARCHAR(50), -- Phone number of the counterparty
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX (entity_id),
+    INDEX (name)
+);
+
+ALTER TABLE plaid_transaction_counterparties
+    ADD COLUMN counterparty_key CHAR(32) AFTER transaction_id,
+    ADD INDEX counterparty_transactions (counterparty_key, transaction_id);
+
+UPDATE plaid_transaction_counterparties
+SET counterparty_key = MD5(IF(entity_id IS NOT NULL AND entity_id <> '',
+    CONCAT('entity:', entity_id),
+    CONCAT('name:', LOWER(TRIM(COALESCE(name, ''))), '|', COALESCE(type, ''))));
+
+ALTER TABLE plaid_transaction_counterparties_history
+    ADD COLUMN counterparty_key CHAR(32) AFTER transaction_id,
+    ADD INDEX counterparty_transactions (counterparty_key, transaction_id);
+
+UPDATE plaid_transaction_counterparties_history
+SET counterparty_key = MD5(IF(entity_id IS NOT NULL AND entity_id <> '',
+    CONCAT('entity:', entity_id),
+    CONCAT('name:', LOWER(TRIM(COALESCE(name, ''))), '|', COALESCE(type, ''))));
+
+# Each dimension row takes the attributes of the most recent link, live rows before history
+INSERT INTO counterparties (counterparty_key, entity_id, name, type, website, logo_url, phone_number)
+SELECT counterparty_key, entity_id, name, type, website, logo_url, phone_number
+FROM (
+    SELECT counterparty_key, entity_id, name, type, website, logo_url, phone_number,
+        ROW_NUMBER() OVER (PARTITION BY counterparty_key ORDER BY id DESC) AS latest
+    FROM plaid_transaction_counterparties
+) links
+WHERE latest = 1;
+
+INSERT IGNORE INTO counterparties (counterparty_key, entity_id, name, type, website, logo_url, phone_number)
+SELECT counterparty_key, entity_id, name, type, website, logo_url, phone_number
+FROM (
+    SELECT counterparty_key, entity_id, name, type, website, logo_url, phone_number,
+        ROW_NUMBER() OVER (PARTITION BY counterparty_key ORDER BY created_at DESC, id DESC) AS latest
+    FROM plaid_transaction_counterparties_history
+) links
+WHERE latest = 1;
+
+ALTER TABLE plaid_transaction_counterparties
+    MODIFY counterparty_key CHAR(32) NOT NULL,
+    DROP COLUMN entity_id,
+    DROP COLUMN name,
+    DROP COLUMN type,
+    DROP COLUMN website,
+    DROP COLUMN logo_url,
+    DROP COLUMN phone_number;
+
+ALTER TABLE plaid_transaction_counterparties_history
+    MODIFY counterparty_key CHAR(32) NOT NULL,
+    DROP COLUMN entity_id,
+    DROP COLUMN name,
+    DROP COLUMN type,
+    DROP COLUMN website,
+    DROP COLUMN logo_url,
+    DROP COLUMN phone_number;
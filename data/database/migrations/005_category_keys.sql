@@ -0,0 +1,62 @@
+# Category foreign keys. Transactions stored their category only as the free-text hierarchy and
+# Plaid's category_id string, so category reports matched strings. categories gets a small integer
+# category_key, which transactions reference, so a rollup is an indexed join on an integer:
+#   SELECT c.hierarchy_level1, SUM(t.amount) FROM plaid_transactions t
+#   JOIN categories c ON c.category_key = t.category_key GROUP BY c.hierarchy_level1
+# The importer resolves category_key through an in-memory cache of the categories table
+# (utils/category_cache.py). The category and category_id columns are kept as imported.
+
+ALTER TABLE categories
+    ADD COLUMN category_key INT UNSIGNED NOT NULL AUTO_INCREMENT UNIQUE FIRST,
+    ADD INDEX hierarchy (hierarchy_level1, hierarchy_level2, hierarchy_level3);
+
+ALTER TABLE plaid_transactions
+    ADD COLUMN category_key INT UNSIGNED AFTER category_id,
+    ADD INDEX category_key_date (category_key, date, amount),
+    ADD CONSTRAINT plaid_transactions_category_key FOREIGN KEY (category_key) REFERENCES categories(category_key);
+
+UPDATE plaid_transactions t
+JOIN categories c ON c.category_id = t.category_id
+SET t.category_key = c.category_key;
+
+# The partitioned history table cannot have the foreign key
+ALTER TABLE plaid_transactions_history
+    ADD COLUMN category_key INT UNSIGNED AFTER category_id;
+
+UPDATE plaid_transactions_history t
+JOIN categories c ON c.category_id = t.category_id
+SET t.category_key = c.category_key;
+
+# The versions view lists its columns, so it is recreated to include category_key
+CREATE OR REPLACE VIEW plaid_transaction_versions AS
+SELECT
+    account_id, transaction_id, account_owner, amount, authorized_date, authorized_datetime, date,
+    datetime, iso_currency_code, logo_url, merchant_entity_id, merchant_name, name,
+    payment_channel, pending, pending_transaction_id, transaction_code, transaction_type,
+    unofficial_currency_code, category, category_id, category_key,
+    personal_finance_category_confidence_level,
+    personal_finance_category_detailed, personal_finance_category_primary,
+    personal_finance_category_icon_url, location_address, location_city, location_region,
+    location_postal_code, location_country, location_lat, location_lon, location_store_number,
+    payment_meta_reference_number, payment_meta_ppd_id, payment_meta_payee,
+    payment_meta_by_order_of, payment_meta_payer, payment_meta_payment_method,
+    payment_meta_payment_processor, payment_meta_reason, website, check_number, row_hash,
+    file_import_id,
+    valid_from, CAST('9999-12-31 23:59:59' AS DATETIME) AS valid_to
+FROM plaid_transactions
+UNION ALL
+SELECT
+    account_id, transaction_id, account_owner, amount, authorized_date, authorized_datetime, date,
+    datetime, iso_currency_code, logo_url, merchant_entity_id, merchant_name, name,
+    payment_channel, pending, pending_transaction_id, transaction_code, transaction_type,
+    unofficial_currency_code, category, category_id, category_key,
+    personal_finance_category_confidence_level,
+    personal_finance_category_detailed, personal_finance_category_primary,
+    personal_finance_category_icon_url, location_address, location_city, location_region,
+    location_postal_code, location_country, location_lat, location_lon, location_store_number,
+    payment_meta_reference_number, payment_meta_ppd_id, payment_meta_payee,
+    payment_meta_by_order_of, payment_meta_payer, payment_meta_payment_method,
+    payment_meta_payment_processor, payment_meta_reason, website, check_number, row_hash,
+    file_import_id,
+    valid_from, valid_to
+FROM plaid_transactions_history;
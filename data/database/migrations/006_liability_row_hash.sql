@@ -0,0 +1,10 @@
+# Change detection for credit liabilities, as row_hash does for transactions. The hash covers the
+# credit row and its APRs, which are versioned as a set, so a credit whose values and APRs match
+# the stored ones is neither archived nor rewritten. Existing rows have no hash and are written
+# once more by the next import.
+
+ALTER TABLE plaid_liabilities_credit
+    ADD COLUMN row_hash CHAR(32) AFTER next_payment_due_date;
+
+ALTER TABLE plaid_liabilities_credit_history
+    ADD COLUMN row_hash CHAR(32) AFTER next_payment_due_date;
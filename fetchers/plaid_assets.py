@@ -4,9 +4,6 @@ import json
 import logging
 import time
 from datetime import datetime, date
-from dotenv import load_dotenv
-from plaid.api import plaid_api
-from plaid import configuration, api_client
 from plaid.api_client import ApiException
 from plaid.model.asset_report_get_request import AssetReportGetRequest
 from plaid.model.asset_report_create_request import AssetReportCreateRequest
@@ -17,43 +14,9 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 
 from utils.plaid_accounts import get_access_tokens_from_db
-
-# Load environment variables from .env file
-load_dotenv()
-
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-PLAID_ENV = os.getenv("PLAID_ENV", "development")
-ASSET_REPORT_TOKEN = os.getenv("ASSET_REPORT_TOKEN")
-
-PLAID_ENV_URLS = {
-    "sandbox": "https://sandbox.plaid.com",
-    "development": "https://development.plaid.com",
-    "production": "https://production.plaid.com"
-}
-PLAID_HOST = PLAID_ENV_URLS.get(PLAID_ENV, "https://production.plaid.com")
-
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
-
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'plaid_assets_{today}.log'),
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
+from utils.rate_limiter import call_plaid
+from utils.plaid_client import get_plaid_client, use_raw_responses, raw_json
+from utils.settings import setup_logging
 
 def convert_datetimes(obj):
     if isinstance(obj, dict):
@@ -73,7 +36,7 @@ def create_asset_report(access_tokens, days_requested=731):
             days_requested=days_requested,
             options=options
         )
-        response = client.asset_report_create(request)
+        response = call_plaid('asset_report_create', get_plaid_client().asset_report_create, request)
         asset_report_token = response['asset_report_token']
         logging.info(f"Asset report created with token: {asset_report_token}")
         print(f"Asset report created with token: {asset_report_token}")
@@ -84,29 +47,30 @@ def create_asset_report(access_tokens, days_requested=731):
         print(f"Error creating asset report: {error_response}")
         return None
 
-def fetch_asset_report(asset_report_token):
+def fetch_asset_report(asset_report_token, raw=None):
+    raw = use_raw_responses(raw)
     try:
         request = AssetReportGetRequest(asset_report_token=asset_report_token)
-        response = client.asset_report_get(request)
-        report = response.to_dict()  # Convert to dict for JSON serialization
+        # PRODUCT_NOT_READY is retried by the limiter; reports can take several minutes to build
+        if raw:
+            report = raw_json(call_plaid('asset_report_get', get_plaid_client().asset_report_get, request, max_retries=10, _preload_content=False))
+        else:
+            response = call_plaid('asset_report_get', get_plaid_client().asset_report_get, request, max_retries=10)
+            report = response.to_dict()  # Convert to dict for JSON serialization
         logging.info(f"Asset report fetched")
         print(f"Asset report fetched")
         return report
     except ApiException as e:
         error_response = json.loads(e.body)
-        if error_response.get('error_code') == 'PRODUCT_NOT_READY':
-            logging.info("Asset report not ready. Retrying in 60 seconds...")
-            print("Asset report not ready. Retrying in 60 seconds...")
-            time.sleep(60)
-            return fetch_asset_report(asset_report_token)
-        else:
-            logging.error(f"Error fetching asset report: {error_response}")
-            print(f"Error fetching asset report: {error_response}")
-            return None
+        logging.error(f"Error fetching asset report: {error_response}")
+        print(f"Error fetching asset report: {error_response}")
+        return None
 
 if __name__ == "__main__":
-    if ASSET_REPORT_TOKEN:
-        report = fetch_asset_report(ASSET_REPORT_TOKEN)
+    setup_logging('plaid_assets')
+    asset_report_token = os.getenv("ASSET_REPORT_TOKEN")
+    if asset_report_token:
+        report = fetch_asset_report(asset_report_token)
     else:
         tokens = get_access_tokens_from_db()
         access_tokens = [token['access_token'] for token in tokens]
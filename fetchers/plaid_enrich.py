@@ -1,73 +1,22 @@
 import os
+import sys
 import json
 import logging
-from dotenv import load_dotenv
 from decimal import Decimal
-from plaid.api import plaid_api
-from plaid import configuration, api_client
 from plaid.model.transactions_enrich_request import TransactionsEnrichRequest
 from plaid.model.client_provided_transaction import ClientProvidedTransaction
 from plaid.model.enrich_transaction_direction import EnrichTransactionDirection
 from datetime import datetime
-from urllib.parse import urlparse
-from mysql.connector import pooling
 from plaid.api_client import ApiException
 
-# Load environment variables from .env file
-load_dotenv()
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
 
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'plaid_enrich_{today}.log'),
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
-
-# Database connection pool
-MYSQL_URL = os.getenv("MYSQL_URL")
-MYSQL_USER = os.getenv("MYSQL_USER")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
-
-url = urlparse(MYSQL_URL)
-connection_pool = pooling.MySQLConnectionPool(
-    pool_name="mypool",
-    pool_size=5,
-    host=url.hostname,
-    port=url.port if url.port else 3306,
-    user=MYSQL_USER,
-    password=MYSQL_PASSWORD,
-    database='finance'  # Hardcoded the database name
-)
-
-def get_db_connection():
-    return connection_pool.get_connection()
-
-# Plaid configuration
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-PLAID_ENV = os.getenv("PLAID_ENV", "development")
-
-PLAID_ENV_URLS = {
-    "sandbox": "https://sandbox.plaid.com",
-    "development": "https://development.plaid.com",
-    "production": "https://production.plaid.com"
-}
-PLAID_HOST = PLAID_ENV_URLS.get(PLAID_ENV, "https://production.plaid.com")
-
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
+from utils.rate_limiter import call_plaid
+from utils.plaid_client import get_plaid_client
+from utils.db import get_db_connection
+from utils.settings import setup_logging
 
 def get_data_to_enrich():
     try:
@@ -106,7 +55,7 @@ def enrich_transactions(transactions):
         )
         
         try:
-            response = client.transactions_enrich(request)
+            response = call_plaid('transactions_enrich', get_plaid_client().transactions_enrich, request)
             results.extend(response.to_dict()['transactions'])
         except ApiException as e:
             print(f"Exception when calling PlaidApi->transactions_enrich: {e}")
@@ -131,4 +80,5 @@ def main():
             save_enriched_data(enriched_data)
 
 if __name__ == "__main__":
+    setup_logging('plaid_enrich')
     main()
@@ -1,10 +1,8 @@
 import os
+import sys
 import json
 import logging
 import pandas as pd
-from dotenv import load_dotenv
-from plaid.api import plaid_api
-from plaid import configuration, api_client
 from plaid.model.transactions_enrich_request import TransactionsEnrichRequest
 from plaid.model.client_provided_transaction import ClientProvidedTransaction
 from plaid.model.enrich_transaction_direction import EnrichTransactionDirection
@@ -12,36 +10,13 @@ from plaid.model.client_provided_transaction_location import ClientProvidedTrans
 from datetime import datetime
 from plaid.api_client import ApiException
 
-# Load environment variables from .env file
-load_dotenv()
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
 
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'plaid_enrich_{today}.log'),
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
-
-# Plaid configuration
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-
-PLAID_HOST = "https://sandbox.plaid.com"
-
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
+from utils.rate_limiter import call_plaid
+from utils.plaid_client import get_plaid_client
+from utils.settings import setup_logging
 
 def get_transactions_from_csv(file_path):
     df = pd.read_csv(file_path)
@@ -85,7 +60,7 @@ def enrich_transactions(transactions):
         )
         
         try:
-            response = client.transactions_enrich(request)
+            response = call_plaid('transactions_enrich', get_plaid_client('sandbox').transactions_enrich, request)
             results.append(response.to_dict())
         except ApiException as e:
             print(f"Exception when calling PlaidApi->transactions_enrich: {e}")
@@ -111,4 +86,5 @@ def main():
             save_enriched_data(enriched_data)
 
 if __name__ == "__main__":
+    setup_logging('plaid_enrich')
     main()
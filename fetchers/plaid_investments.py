@@ -3,11 +3,7 @@ import os
 import sys
 import json
 import logging
-import time
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from plaid.api import plaid_api
-from plaid import configuration, api_client
 from plaid.api_client import ApiException
 from plaid.model.investments_holdings_get_request import InvestmentsHoldingsGetRequest
 from plaid.model.investments_transactions_get_request import InvestmentsTransactionsGetRequest
@@ -17,51 +13,22 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 
 from utils.plaid_accounts import get_access_tokens_from_db
-
-# Load environment variables from .env file
-load_dotenv()
-
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-PLAID_ENV = os.getenv("PLAID_ENV", "development")
-
-PLAID_ENV_URLS = {
-    "sandbox": "https://sandbox.plaid.com",
-    "development": "https://development.plaid.com",
-    "production": "https://production.plaid.com"
-}
-PLAID_HOST = PLAID_ENV_URLS.get(PLAID_ENV, "https://production.plaid.com")
-
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
-
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'plaid_investments_{today}.log'),
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
+from utils.rate_limiter import call_plaid
+from utils.plaid_client import get_plaid_client, use_raw_responses, raw_json
+from utils.settings import setup_logging
 
 def save_response_to_file(response, filename):
     with open(filename, 'w') as file:
         json.dump(response, file, indent=4)
 
-def fetch_investment_holdings(access_token, bank_name):
+def fetch_investment_holdings(access_token, bank_name, raw=None):
+    raw = use_raw_responses(raw)
     try:
         request = InvestmentsHoldingsGetRequest(access_token=access_token)
-        response = client.investments_holdings_get(request).to_dict()
+        if raw:
+            response = raw_json(call_plaid('investments_holdings_get', get_plaid_client().investments_holdings_get, request, _preload_content=False))
+        else:
+            response = call_plaid('investments_holdings_get', get_plaid_client().investments_holdings_get, request).to_dict()
         
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         filename = f'data/fetched-files/plaid_investments_holdings_{bank_name}_{timestamp}.json'
@@ -79,7 +46,8 @@ def fetch_investment_holdings(access_token, bank_name):
         logging.error(message)
         return None
 
-def fetch_investment_transactions(access_token, bank_name, start_date=None, end_date=None):
+def fetch_investment_transactions(access_token, bank_name, start_date=None, end_date=None, raw=None):
+    raw = use_raw_responses(raw)
     if start_date is None:
         start_date = datetime.now() - timedelta(days=365*5)  # 5 years ago by default
     if end_date is None:
@@ -94,7 +62,10 @@ def fetch_investment_transactions(access_token, bank_name, start_date=None, end_
             start_date=start_date,
             end_date=end_date
         )
-        response = client.investments_transactions_get(request).to_dict()
+        if raw:
+            response = raw_json(call_plaid('investments_transactions_get', get_plaid_client().investments_transactions_get, request, _preload_content=False))
+        else:
+            response = call_plaid('investments_transactions_get', get_plaid_client().investments_transactions_get, request).to_dict()
         
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         filename = f'data/fetched-files/plaid_investments_transactions_{bank_name}_{timestamp}.json'
@@ -113,6 +84,7 @@ def fetch_investment_transactions(access_token, bank_name, start_date=None, end_
         return None
 
 if __name__ == "__main__":
+    setup_logging('plaid_investments')
     tokens = get_access_tokens_from_db()
     
     for token in tokens:
@@ -1,51 +1,18 @@
 import os
+import sys
 import json
 import logging
-from dotenv import load_dotenv
-from plaid.api import plaid_api
-from plaid import configuration, api_client
 from plaid.api_client import ApiException
 from plaid.model.liabilities_get_request import LiabilitiesGetRequest
 from datetime import datetime, date
-import time
-import time
 
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
 
-# Load environment variables from .env file
-load_dotenv()
-
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-PLAID_ENV = os.getenv("PLAID_ENV", "development")
-
-PLAID_ENV_URLS = {
-    "sandbox": "https://sandbox.plaid.com",
-    "development": "https://development.plaid.com",
-    "production": "https://production.plaid.com"
-}
-PLAID_HOST = PLAID_ENV_URLS.get(PLAID_ENV, "https://development.plaid.com")
-
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
-
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'plaid_liabilities_{today}.log'),
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
+from utils.rate_limiter import call_plaid
+from utils.plaid_client import get_plaid_client, use_raw_responses, raw_json
+from utils.settings import setup_logging
 
 def convert_dates_to_strings(obj):
     if isinstance(obj, dict):
@@ -57,14 +24,17 @@ def convert_dates_to_strings(obj):
         obj = obj.isoformat()
     return obj
 
-def fetch_liabilities(access_token, bank_name):
+def fetch_liabilities(access_token, bank_name, raw=None):
+    raw = use_raw_responses(raw)
     logging.info(f"Fetching liabilities for {bank_name}...")
     try:
         request = LiabilitiesGetRequest(access_token=access_token)
-        response = client.liabilities_get(request)
-        liabilities = response['liabilities']
-        
-        liabilities_dict = convert_dates_to_strings(liabilities.to_dict())
+        if raw:
+            response = raw_json(call_plaid('liabilities_get', get_plaid_client().liabilities_get, request, _preload_content=False))
+            liabilities_dict = response['liabilities']
+        else:
+            response = call_plaid('liabilities_get', get_plaid_client().liabilities_get, request)
+            liabilities_dict = convert_dates_to_strings(response['liabilities'].to_dict())
 
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         filename = f'data/fetched-files/plaid_liabilities_{bank_name}_{timestamp}.json'
@@ -77,25 +47,18 @@ def fetch_liabilities(access_token, bank_name):
 
         return filename
     except ApiException as e:
-        error_response = json.loads(e.body)
-        error_code = error_response.get('error_code')
-        if error_code == 'RATE_LIMIT_EXCEEDED':
-            print("Rate limit exceeded, sleeping for 60 seconds...")
-            logging.info("Rate limit exceeded, sleeping for 60 seconds...")
-            time.sleep(60)
-            return fetch_liabilities(access_token, bank_name)
-        else:
-            message = f"Error fetching liabilities for {bank_name}: {e}"
-            print(message)
-            logging.error(message)
-            return None
+        message = f"Error fetching liabilities for {bank_name}: {e}"
+        print(message)
+        logging.error(message)
+        return None
     except Exception as e:
         message = f"Error fetching liabilities for {bank_name}: {e}"
         print(message)
         logging.error(message)
         return None
 
-if __name__ == "__main__": 
+if __name__ == "__main__":
+    setup_logging('plaid_liabilities')
     access_token = os.getenv("NEW_ACCOUNT_TOKEN")
     bank_name = os.getenv("NEW_BANK_NAME")
     print(f"Starting liabilities fetch process for {bank_name}...")
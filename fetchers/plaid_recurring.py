@@ -2,11 +2,7 @@ import os
 import sys
 import json
 import logging
-import time
 from datetime import datetime, date
-from dotenv import load_dotenv
-from plaid.api import plaid_api
-from plaid import configuration, api_client
 from plaid.api_client import ApiException
 from plaid.model.transactions_recurring_get_request import TransactionsRecurringGetRequest
 
@@ -15,42 +11,9 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 
 from utils.plaid_accounts import get_access_tokens_from_db
-
-# Load environment variables from .env file
-load_dotenv()
-
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-PLAID_ENV = os.getenv("PLAID_ENV", "development")
-
-PLAID_ENV_URLS = {
-    "sandbox": "https://sandbox.plaid.com",
-    "development": "https://development.plaid.com",
-    "production": "https://production.plaid.com"
-}
-PLAID_HOST = PLAID_ENV_URLS.get(PLAID_ENV, "https://production.plaid.com")
-
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
-
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'plaid_recurring_transactions_{today}.log'),
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
+from utils.rate_limiter import call_plaid
+from utils.plaid_client import get_plaid_client, use_raw_responses, raw_json
+from utils.settings import setup_logging
 
 def convert_dates_to_strings(obj):
     if isinstance(obj, dict):
@@ -62,14 +25,17 @@ def convert_dates_to_strings(obj):
     else:
         return obj
 
-def fetch_recurring_transactions(access_token, bank_name):
+def fetch_recurring_transactions(access_token, bank_name, raw=None):
+    raw = use_raw_responses(raw)
     try:
         request = TransactionsRecurringGetRequest(
             access_token=access_token
         )
-        response = client.transactions_recurring_get(request)
-        
-        response_dict = convert_dates_to_strings(response.to_dict())
+        if raw:
+            response_dict = raw_json(call_plaid('transactions_recurring_get', get_plaid_client().transactions_recurring_get, request, _preload_content=False))
+        else:
+            response = call_plaid('transactions_recurring_get', get_plaid_client().transactions_recurring_get, request)
+            response_dict = convert_dates_to_strings(response.to_dict())
         
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         filename = f'data/fetched-files/plaid_recurring_transactions_{bank_name}_{timestamp}.json'
@@ -83,19 +49,13 @@ def fetch_recurring_transactions(access_token, bank_name):
         return filename
 
     except ApiException as e:
-        error_response = json.loads(e.body)
-        error_code = error_response.get('error_code')
-        if error_code == 'RATE_LIMIT_EXCEEDED':
-            print("Rate limit exceeded, sleeping for 60 seconds...")
-            logging.info("Rate limit exceeded, sleeping for 60 seconds...")
-            time.sleep(60)
-            fetch_recurring_transactions(access_token, bank_name)
-        else:
-            message = f"Error fetching recurring transactions for {bank_name}: {e}"
-            print(message)
-            logging.error(message)
+        message = f"Error fetching recurring transactions for {bank_name}: {e}"
+        print(message)
+        logging.error(message)
+        return None
 
 if __name__ == "__main__":
+    setup_logging('plaid_recurring_transactions')
     
     tokens = get_access_tokens_from_db()
     
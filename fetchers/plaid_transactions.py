@@ -2,56 +2,23 @@ import os
 import sys
 import json
 import logging
-import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, date
-from dotenv import load_dotenv
-from plaid.api import plaid_api
-from plaid import configuration, api_client
 from plaid.api_client import ApiException
 from plaid.model.transactions_get_request import TransactionsGetRequest
 from plaid.model.transactions_get_request_options import TransactionsGetRequestOptions
+from plaid.model.transactions_sync_request import TransactionsSyncRequest
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if project_root not in sys.path:
     sys.path.append(project_root)
 
 from utils.plaid_accounts import get_access_tokens_from_db
-
-# Load environment variables from .env file
-load_dotenv()
-
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-PLAID_ENV = os.getenv("PLAID_ENV", "development")
-
-PLAID_ENV_URLS = {
-    "sandbox": "https://sandbox.plaid.com",
-    "development": "https://development.plaid.com",
-    "production": "https://production.plaid.com"
-}
-PLAID_HOST = PLAID_ENV_URLS.get(PLAID_ENV, "https://production.plaid.com")
-
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
-
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'plaid_transactions_{today}.log'),
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
+from utils.rate_limiter import call_plaid, parse_plaid_error
+from utils.ndjson import write_ndjson
+from utils.plaid_client import get_plaid_client, use_raw_responses, raw_json
+from utils.settings import get_settings, setup_logging
 
 def convert_dates_to_strings(obj):
     if isinstance(obj, dict):
@@ -65,9 +32,49 @@ def convert_dates_to_strings(obj):
         obj = obj.isoformat()
     return obj
 
-def fetch_transactions(access_token, bank_name, start_date=None, end_date=None):
+def transaction_to_dict(transaction):
+    # Raw responses are already plain JSON dicts; models still need converting
+    if isinstance(transaction, dict):
+        return transaction
+    return convert_dates_to_strings(transaction.to_dict())
+
+def fetch_transactions_window(access_token, start_date, end_date, page_size=500, raw=None):
+    # Offset-paginates a single date window, yielding one page of transactions at a time
+    raw = use_raw_responses(raw)
+    options = TransactionsGetRequestOptions()
+    options.count = page_size
+    options.offset = 0
+    fetched = 0
+
+    while True:
+        request = TransactionsGetRequest(
+            access_token=access_token,
+            start_date=start_date,
+            end_date=end_date,
+            options=options
+        )
+        if raw:
+            response = raw_json(call_plaid('transactions_get', get_plaid_client().transactions_get, request, _preload_content=False))
+        else:
+            response = call_plaid('transactions_get', get_plaid_client().transactions_get, request)
+        transactions = response['transactions']
+        fetched += len(transactions)
+        yield transactions
+
+        # Check if we need to paginate
+        if len(transactions) == 0 or fetched >= response['total_transactions']:
+            break
+
+        options.offset += len(transactions)
+
+def remove_partial_file(filename):
+    if os.path.exists(filename):
+        os.remove(filename)
+
+def fetch_transactions(access_token, bank_name, start_date=None, end_date=None, output_format=None):
     all_transactions = []
     total_transactions = 0
+    output_format = output_format or get_settings().plaid_output_format
 
     if start_date is None:
         start_date = datetime.now() - timedelta(days=365*5)  # 5 years ago by default
@@ -77,58 +84,190 @@ def fetch_transactions(access_token, bank_name, start_date=None, end_date=None):
     start_date = start_date.date()
     end_date = end_date.date()
 
-    options = TransactionsGetRequestOptions()
-    options.count = 500  # Adjust the count as needed
-    options.offset = 0
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    extension = 'ndjson' if output_format == 'ndjson' else 'json'
+    filename = f'data/fetched-files/plaid_transactions_{bank_name}_{timestamp}.{extension}'
+
+    try:
+        # In ndjson mode each page is serialized as soon as it arrives, so memory stays bounded by the page size
+        with open(filename, 'w') if output_format == 'ndjson' else nullcontext() as ndjson_file:
+            for transactions in fetch_transactions_window(access_token, start_date, end_date):
+                if ndjson_file:
+                    write_ndjson(ndjson_file, (transaction_to_dict(transaction) for transaction in transactions))
+                else:
+                    all_transactions.extend(transactions)
+                total_transactions += len(transactions)
+
+                print(f"Fetched {len(transactions)} transactions in this batch. Total so far: {total_transactions}")
+
+        if output_format != 'ndjson':
+            transactions_dicts = [transaction_to_dict(transaction) for transaction in all_transactions]
+            with open(filename, 'w') as file:
+                json.dump(transactions_dicts, file, indent=4)
+
+    except ApiException as e:
+        # A truncated window must not be imported as if it were complete
+        remove_partial_file(filename)
+        message = f"Error fetching transactions for {bank_name}: {e}"
+        print(message)
+        logging.error(message)
+        return None
+    except Exception:
+        remove_partial_file(filename)
+        raise
+
+    message = f"Transactions for {bank_name} fetched and saved successfully as {filename}. Total transactions: {total_transactions}"
+    print(message)
+    logging.info(message)
+    return filename
+
+def split_into_month_windows(start_date, end_date):
+    windows = []
+    window_start = start_date
+    while window_start <= end_date:
+        if window_start.month == 12:
+            next_month = date(window_start.year + 1, 1, 1)
+        else:
+            next_month = date(window_start.year, window_start.month + 1, 1)
+        window_end = min(next_month - timedelta(days=1), end_date)
+        windows.append((window_start, window_end))
+        window_start = next_month
+    return windows
+
+def fetch_window_dicts(access_token, start_date, end_date):
+    transactions = []
+    for page in fetch_transactions_window(access_token, start_date, end_date):
+        transactions.extend(transaction_to_dict(transaction) for transaction in page)
+    return transactions
+
+def fetch_transactions_backfill(access_token, bank_name, start_date=None, end_date=None, max_workers=None, output_format=None):
+    # Splits the range into monthly windows fetched concurrently. Every window shares the
+    # process-wide transactions_get rate budget, so more workers never means more than the limiter allows.
+    max_workers = max_workers or get_settings().backfill_max_workers
+    output_format = output_format or get_settings().plaid_output_format
+
+    if start_date is None:
+        start_date = datetime.now() - timedelta(days=365*5)  # 5 years ago by default
+    if end_date is None:
+        end_date = datetime.now()
+
+    windows = split_into_month_windows(start_date.date(), end_date.date())
+    transactions_by_id = {}
+    failed_windows = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_window_dicts, access_token, window_start, window_end): (window_start, window_end)
+            for window_start, window_end in windows
+        }
+        for future in as_completed(futures):
+            window_start, window_end = futures[future]
+            try:
+                transactions = future.result()
+            except ApiException as e:
+                failed_windows.append((window_start, window_end))
+                message = f"Error fetching transactions for {bank_name} between {window_start} and {window_end}: {e}"
+                print(message)
+                logging.error(message)
+                continue
+
+            # Windows never overlap, but pending/posted updates can move a transaction across a boundary between calls
+            for transaction in transactions:
+                transactions_by_id[transaction['transaction_id']] = transaction
+            print(f"Fetched {len(transactions)} transactions between {window_start} and {window_end}. Total so far: {len(transactions_by_id)}")
+
+    if failed_windows:
+        message = f"Backfill for {bank_name} incomplete: {len(failed_windows)} of {len(windows)} date windows failed."
+        print(message)
+        logging.error(message)
+        return None
+
+    transactions_dicts = sorted(transactions_by_id.values(), key=lambda transaction: transaction['date'])
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    extension = 'ndjson' if output_format == 'ndjson' else 'json'
+    filename = f'data/fetched-files/plaid_transactions_{bank_name}_{timestamp}.{extension}'
+    with open(filename, 'w') as file:
+        if output_format == 'ndjson':
+            write_ndjson(file, transactions_dicts)
+        else:
+            json.dump(transactions_dicts, file, indent=4)
+
+    message = (f"Transactions backfill for {bank_name} fetched and saved successfully as {filename}. "
+               f"Windows: {len(windows)}, total transactions: {len(transactions_dicts)}")
+    print(message)
+    logging.info(message)
+    return filename
+
+def fetch_transactions_sync(access_token, bank_name, cursor=None, raw=None, token_id=None):
+    # Incremental fetch through /transactions/sync. Only the changes since `cursor`
+    # are returned; the importer persists next_cursor once the deltas are applied,
+    # so a failed import simply replays the same changes on the next run.
+    # token_id identifies the item's plaid_access_tokens row whose cursor the import advances.
+    raw = use_raw_responses(raw)
+    added = []
+    modified = []
+    removed = []
+    next_cursor = cursor
 
     while True:
         try:
-            request = TransactionsGetRequest(
-                access_token=access_token,
-                start_date=start_date,
-                end_date=end_date,
-                options=options
-            )
-            response = client.transactions_get(request)
-            print(response)
-            transactions = response['transactions']
-            all_transactions.extend(transactions)
-            total_transactions += len(transactions)
-            
-            print(f"Fetched {len(transactions)} transactions in this batch. Total so far: {total_transactions}")
-
-            # Check if we need to paginate
-            if len(transactions) == 0 or total_transactions >= response['total_transactions']:
-                break
+            request_args = {'access_token': access_token, 'count': 500}
+            if next_cursor:
+                request_args['cursor'] = next_cursor
+            request = TransactionsSyncRequest(**request_args)
+            if raw:
+                response = raw_json(call_plaid('transactions_sync', get_plaid_client().transactions_sync, request, _preload_content=False))
+            else:
+                response = call_plaid('transactions_sync', get_plaid_client().transactions_sync, request)
+
+            added.extend(response['added'])
+            modified.extend(response['modified'])
+            removed.extend(response['removed'])
+            next_cursor = response['next_cursor']
 
-            options.offset += len(transactions)
+            print(f"Synced {len(response['added'])} added, {len(response['modified'])} modified, "
+                  f"{len(response['removed'])} removed transactions in this batch.")
+
+            if not response['has_more']:
+                break
 
         except ApiException as e:
-            error_response = json.loads(e.body)
-            error_code = error_response.get('error_code')
-            if error_code == 'RATE_LIMIT_EXCEEDED':
-                print("Rate limit exceeded, sleeping for 60 seconds...")
-                logging.info("Rate limit exceeded, sleeping for 60 seconds...")
-                time.sleep(60)
+            error_code = parse_plaid_error(e).get('error_code')
+            if error_code == 'TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION':
+                # Plaid requires restarting the whole pagination loop from the original cursor
+                message = f"Transactions changed during sync pagination for {bank_name}, restarting from last cursor..."
+                print(message)
+                logging.info(message)
+                added, modified, removed = [], [], []
+                next_cursor = cursor
                 continue
             else:
-                message = f"Error fetching transactions for {bank_name}: {e}"
+                message = f"Error syncing transactions for {bank_name}: {e}"
                 print(message)
                 logging.error(message)
-                break
+                return None
 
-    transactions_dicts = [convert_dates_to_strings(transaction.to_dict()) for transaction in all_transactions]
+    sync_data = {
+        'token_id': token_id,
+        'cursor': cursor,
+        'next_cursor': next_cursor,
+        'added': [transaction_to_dict(transaction) for transaction in added],
+        'modified': [transaction_to_dict(transaction) for transaction in modified],
+        'removed': [transaction['transaction_id'] for transaction in removed]
+    }
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    filename = f'data/fetched-files/plaid_transactions_{bank_name}_{timestamp}.json'
+    filename = f'data/fetched-files/plaid_transactions_sync_{bank_name}_{timestamp}.json'
     with open(filename, 'w') as file:
-        json.dump(transactions_dicts, file, indent=4)
+        json.dump(sync_data, file, indent=4)
 
-    message = f"Transactions for {bank_name} fetched and saved successfully as {filename}. Total transactions: {total_transactions}"
+    message = (f"Transactions for {bank_name} synced and saved successfully as {filename}. "
+               f"Added: {len(added)}, modified: {len(modified)}, removed: {len(removed)}")
     print(message)
     logging.info(message)
     return filename
 
 if __name__ == "__main__":
+    setup_logging('plaid_transactions')
     
     tokens = get_access_tokens_from_db()
     
@@ -141,7 +280,12 @@ if __name__ == "__main__":
         logging.info(f"Starting transactions fetch process for {bank_name}...")
 
         if access_token:
-            fetch_transactions(access_token, bank_name)
+            if get_settings().plaid_transactions_mode == 'sync':
+                fetch_transactions_sync(access_token, bank_name, token.get('transactions_cursor'), token_id=token.get('token_id'))
+            elif get_settings().plaid_transactions_mode == 'backfill':
+                fetch_transactions_backfill(access_token, bank_name)
+            else:
+                fetch_transactions(access_token, bank_name)
         else:
             message = "Access token is required."
             print(message)
@@ -0,0 +1,132 @@
+import os
+import sys
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+import importers.insert_transactions as insert_transactions
+import importers.insert_liabilities as insert_liabilities
+import importers.insert_recurring as insert_recurring
+import importers.insert_assets as insert_assets
+from utils.ndjson import read_ndjson
+from utils.json_stream import iter_json_items
+from utils.db import log_pool_metrics
+from utils.import_ledger import check_file, get_import_ledger
+from utils.category_cache import get_category_cache
+from utils.settings import get_settings, setup_logging
+
+FETCHED_FILES_DIR = 'data/fetched-files'
+
+def import_transactions_sync(file_path, bank_name, content_hash):
+    sync_data = insert_transactions.read_sync_file(file_path)
+    return insert_transactions.insert_transactions_sync(sync_data, bank_name, os.path.basename(file_path), content_hash)
+
+def import_transactions_ndjson(file_path, bank_name, content_hash):
+    return insert_transactions.insert_transactions(read_ndjson(file_path), bank_name, os.path.basename(file_path), content_hash)
+
+def import_transactions_json(file_path, bank_name, content_hash):
+    return insert_transactions.insert_transactions(iter_json_items(file_path), bank_name, os.path.basename(file_path), content_hash)
+
+def import_liabilities(file_path, bank_name, content_hash):
+    liabilities_data = insert_liabilities.read_liabilities_file(file_path)
+    return insert_liabilities.insert_liabilities(liabilities_data, bank_name, os.path.basename(file_path), content_hash)
+
+def import_recurring(file_path, bank_name, content_hash):
+    recurring_data = insert_recurring.read_recurring_file(file_path)
+    return insert_recurring.insert_transactions(recurring_data, bank_name, os.path.basename(file_path), content_hash)
+
+def import_asset_report(file_path, bank_name, content_hash):
+    # Asset reports keep their own check on asset_report.file_path
+    return insert_assets.process_json_file(file_path)
+
+# (prefix, extension, position of the bank name in the '_'-separated file name, importer).
+# An importer returns None when the file had already been imported, and raises when it fails.
+# The first match wins, so the more specific prefixes come first. Asset reports are not
+# tied to a bank and are imported as their own group.
+FILE_TYPES = [
+    ('plaid_transactions_sync_', '.json', 3, import_transactions_sync),
+    ('plaid_transactions_', '.ndjson', 2, import_transactions_ndjson),
+    ('plaid_transactions_', '.json', 2, import_transactions_json),
+    ('plaid_liabilities_', '.json', 2, import_liabilities),
+    ('plaid_recurring_transactions_', '.json', 3, import_recurring),
+    ('plaid_asset_report_', '.json', None, import_asset_report),
+]
+
+def classify_file(file_name):
+    for prefix, extension, bank_position, importer in FILE_TYPES:
+        if file_name.startswith(prefix) and file_name.endswith(extension):
+            bank_name = file_name.split('_')[bank_position] if bank_position is not None else 'asset_report'
+            timestamp = os.path.splitext(file_name)[0].rsplit('_', 1)[-1]  # <prefix>_<bank>_<%Y%m%d%H%M%S>
+            return bank_name, timestamp, importer
+    return None
+
+def group_files_by_bank(directory):
+    # Each bank's files are sorted by fetch timestamp, so history and sync cursors apply in order
+    groups = {}
+    for file_name in os.listdir(directory):
+        classified = classify_file(file_name)
+        if classified:
+            bank_name, timestamp, importer = classified
+            groups.setdefault(bank_name, []).append((timestamp, file_name, importer))
+    return {bank_name: sorted(files, key=lambda f: (f[0], f[1])) for bank_name, files in groups.items()}
+
+def import_bank_files(directory, bank_name, files):
+    result = {'bank_name': bank_name, 'files': 0, 'skipped': 0, 'errors': []}
+    start = time.monotonic()
+    for position, (timestamp, file_name, importer) in enumerate(files):
+        file_path = os.path.join(directory, file_name)
+        try:
+            content_hash = check_file(file_path, file_name)
+            if not content_hash:
+                result['skipped'] += 1
+                continue
+            if importer(file_path, bank_name, content_hash) is None:
+                result['skipped'] += 1
+                continue
+            result['files'] += 1
+        except Exception as e:
+            # The importers roll back their own transaction and re-raise. The bank's newer files
+            # are not applied over the gap: importing the failed file later would overwrite their
+            # rows and move sync cursors backwards. Other banks carry on.
+            result['errors'].append(f"{file_name}: {e}")
+            remaining = len(files) - position - 1
+            result['skipped'] += remaining
+            message = f"Error importing {file_name} for {bank_name}: {e}. Skipping the bank's {remaining} later files"
+            print(message)
+            logging.error(message)
+            break
+    result['seconds'] = round(time.monotonic() - start, 2)
+    return result
+
+def run_imports(directory=FETCHED_FILES_DIR, max_workers=None):
+    # Banks are imported concurrently, each on its own pooled connection; one bank's files run in sequence.
+    # Keep IMPORT_MAX_WORKERS below the MySQL pool size.
+    max_workers = max_workers or get_settings().import_max_workers
+    groups = group_files_by_bank(directory)
+    get_import_ledger()  # Loaded once, before the workers start
+    get_category_cache()
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(import_bank_files, directory, bank_name, files) for bank_name, files in groups.items()]
+        for future in as_completed(futures):
+            results.append(future.result())
+    return sorted(results, key=lambda r: r['bank_name'])
+
+if __name__ == "__main__":
+    setup_logging('import_runner')
+    logging.info("Starting import of fetched files...")
+    print("Starting import of fetched files...")
+
+    for result in run_imports():
+        status = f"{len(result['errors'])} failed" if result['errors'] else "ok"
+        message = (f"{result['bank_name']}: {result['files']} files, {result['skipped']} skipped "
+                   f"in {result['seconds']}s ({status})")
+        print(message)
+        logging.info(message)
+    insert_transactions.compact_pending_transactions()
+    log_pool_metrics()
@@ -1,42 +1,34 @@
 import os
-import json
+import sys
 import logging
-from mysql.connector import pooling, IntegrityError
-from urllib.parse import urlparse
+from mysql.connector import IntegrityError
 from datetime import datetime
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-MYSQL_URL = os.getenv("MYSQL_URL")
-MYSQL_USER = os.getenv("MYSQL_USER")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
-
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'insert_assets_{today}.log'),
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
-
-dbconfig = {
-    "host": urlparse(MYSQL_URL).hostname,
-    "port": urlparse(MYSQL_URL).port if urlparse(MYSQL_URL).port else 3306,
-    "user": MYSQL_USER,
-    "password": MYSQL_PASSWORD,
-    "database": urlparse(MYSQL_URL).path.lstrip('/')
-}
 
-connection_pool = pooling.MySQLConnectionPool(pool_name="mypool", pool_size=5, **dbconfig)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.db import get_db_connection, bulk_insert, staging_batch_size, retrying_cursor
+from utils.json_stream import JSONError, ObjectBuilder, SCALAR_EVENTS, iter_json_events
+from utils.settings import setup_logging
+
+ASSET_ITEM_COLUMNS = [
+    'item_id', 'asset_report_id', 'institution_name', 'institution_id', 'date_last_updated'
+]
+
+ASSET_ACCOUNT_COLUMNS = [
+    'account_id', 'item_id', 'available', 'current', 'limit', 'margin_loan_amount', 'iso_currency_code',
+    'unofficial_currency_code', 'mask', 'name', 'official_name', 'type', 'subtype', 'days_available', 'asset_report_id'
+]
 
-def get_db_connection():
-    return connection_pool.get_connection()
+ASSET_TRANSACTION_COLUMNS = [
+    'transaction_id', 'account_id', 'amount', 'iso_currency_code', 'unofficial_currency_code',
+    'original_description', 'date', 'pending', 'asset_report_id'
+]
+
+HISTORICAL_BALANCE_COLUMNS = [
+    'account_id', 'date', 'current', 'iso_currency_code', 'unofficial_currency_code', 'asset_report_id'
+]
 
 def is_file_imported(file_name):
     file_name = os.path.abspath(file_name)  # Convert to absolute path
@@ -48,75 +40,18 @@ def is_file_imported(file_name):
     conn.close()
     return result > 0
 
-# Function to insert data into asset_report table
-def insert_asset_report(report, file_path):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    sql = """
-    INSERT INTO asset_report (asset_report_id, client_report_id, date_generated, days_requested, file_path)
-    VALUES (%s, %s, %s, %s, %s)
-    """
-    # Read the entire JSON file content
-    with open(file_path, 'r') as file:
-        json_content = json.load(file)
-
-    values = (
-        report['asset_report_id'],
-        report.get('client_report_id'),
-        datetime.fromisoformat(report['date_generated'].replace('Z', '')),
-        int(report['days_requested']),
-        os.path.abspath(file_path),  # Use absolute path to store the full file path
-    )
-    try:
-        cursor.execute(sql, values)
-        conn.commit()
-        logging.info(f"Asset report inserted successfully: {report['asset_report_id']} from file {file_path}")
-        print("Asset report inserted successfully!")
-    except IntegrityError as e:
-        logging.error(f"Duplicate entry for asset report: {report['asset_report_id']} - {e}")
-        print(f"Duplicate entry for asset report: {report['asset_report_id']} - {e}")
-    finally:
-        cursor.close()
-        conn.close()
-
-# Function to insert data into item table
-def insert_item(item, asset_report_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    sql = """
-    INSERT INTO asset_item (item_id, asset_report_id, institution_name, institution_id, date_last_updated)
-    VALUES (%s, %s, %s, %s, %s)
-    """
-    values = (
+def asset_item_row(item, asset_report_id):
+    return (
         item['item_id'],
         asset_report_id,
         item['institution_name'],
         item['institution_id'],
         datetime.fromisoformat(item['date_last_updated'].replace('Z', ''))
     )
-    try:
-        cursor.execute(sql, values)
-        conn.commit()
-        logging.info(f"Item inserted successfully: {item['item_id']} for asset report: {asset_report_id}")
-        print("Item inserted successfully!")
-    except IntegrityError as e:
-        logging.error(f"Duplicate entry for item: {item['item_id']} - {e}")
-        print(f"Duplicate entry for item: {item['item_id']} - {e}")
-    finally:
-        cursor.close()
-        conn.close()
 
-# Function to insert data into account table
-def insert_account(account, item_id, asset_report_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def asset_account_row(account, item_id, asset_report_id):
     balances = account['balances']
-    sql = """
-    INSERT INTO asset_account (account_id, item_id, available, current, `limit`, margin_loan_amount, iso_currency_code,
-                         unofficial_currency_code, mask, name, official_name, type, subtype, days_available, asset_report_id)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    """
-    values = (
+    return (
         account['account_id'],
         item_id,
         balances['available'],
@@ -133,28 +68,9 @@ def insert_account(account, item_id, asset_report_id):
         int(account['days_available']),
         asset_report_id
     )
-    try:
-        cursor.execute(sql, values)
-        conn.commit()
-        logging.info(f"Account inserted successfully: {account['account_id']} for item: {item_id}")
-        print("Account inserted successfully!")
-    except IntegrityError as e:
-        logging.error(f"Duplicate entry for account: {account['account_id']} - {e}")
-        print(f"Duplicate entry for account: {account['account_id']} - {e}")
-    finally:
-        cursor.close()
-        conn.close()
 
-# Function to insert data into transaction table
-def insert_transaction(transaction, asset_report_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    sql = """
-    INSERT INTO asset_transaction (transaction_id, account_id, amount, iso_currency_code, unofficial_currency_code,
-                             original_description, date, pending, asset_report_id)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-    """
-    values = (
+def asset_transaction_row(transaction, asset_report_id):
+    return (
         transaction['transaction_id'],
         transaction['account_id'],
         transaction['amount'],
@@ -165,26 +81,9 @@ def insert_transaction(transaction, asset_report_id):
         transaction['pending'],
         asset_report_id
     )
-    try:
-        cursor.execute(sql, values)
-        conn.commit()
-        print("Transaction inserted successfully!")
-    except IntegrityError as e:
-        logging.error(f"Duplicate entry for transaction: {transaction['transaction_id']} - {e}")
-        print(f"Duplicate entry for transaction: {transaction['transaction_id']} - {e}")
-    finally:
-        cursor.close()
-        conn.close()
 
-# Function to insert data into historical_balance table
-def insert_historical_balance(balance, account_id, asset_report_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    sql = """
-    INSERT INTO asset_historical_balance (account_id, date, current, iso_currency_code, unofficial_currency_code, asset_report_id)
-    VALUES (%s, %s, %s, %s, %s, %s)
-    """
-    values = (
+def historical_balance_row(balance, account_id, asset_report_id):
+    return (
         account_id,
         balance['date'],
         balance['current'],
@@ -192,22 +91,157 @@ def insert_historical_balance(balance, account_id, asset_report_id):
         balance.get('unofficial_currency_code'),
         asset_report_id
     )
+
+REPORT_FIELDS = ('asset_report_id', 'client_report_id', 'date_generated', 'days_requested')
+
+# Function to read the report's own fields, stopping the parse once all of them are seen
+def read_report_header(filepath):
+    header = {}
+    for prefix, event, value in iter_json_events(filepath):
+        field = prefix[len('report.'):] if prefix.startswith('report.') else None
+        if field in REPORT_FIELDS and event in SCALAR_EVENTS:
+            header[field] = value
+            if len(header) == len(REPORT_FIELDS):
+                break
+    return header
+
+# Function to stream the items and accounts of an asset report while the file is parsed.
+# Yields ('account', item, account) for every account, then ('item', item, None) once the item
+# is complete, so only one account is held in memory at a time.
+def iter_report_accounts(filepath):
+    item, pending, builder = None, [], None
+    for prefix, event, value in iter_json_events(filepath):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == 'report.items.item.accounts.item' and event == 'end_map':
+                if 'item_id' in item:
+                    yield 'account', item, builder.value
+                else:
+                    pending.append(builder.value)  # Accounts listed before the item's own fields
+                builder = None
+        elif prefix == 'report.items.item.accounts.item' and event == 'start_map':
+            builder = ObjectBuilder()
+            builder.event(event, value)
+        elif prefix == 'report.items.item' and event == 'start_map':
+            item, pending = {}, []
+        elif prefix == 'report.items.item' and event == 'end_map':
+            for account in pending:
+                yield 'account', item, account
+            yield 'item', item, None
+        elif item is not None and prefix.startswith('report.items.item.') and event in SCALAR_EVENTS:
+            field = prefix[len('report.items.item.'):]
+            if '.' not in field:
+                item[field] = value
+
+# Function to insert data into asset_report table
+def insert_asset_report(cursor, report, file_path):
+    sql = """
+    INSERT INTO asset_report (asset_report_id, client_report_id, date_generated, days_requested, file_path)
+    VALUES (%s, %s, %s, %s, %s)
+    """
+    values = (
+        report['asset_report_id'],
+        report.get('client_report_id'),
+        datetime.fromisoformat(report['date_generated'].replace('Z', '')),
+        int(report['days_requested']),
+        os.path.abspath(file_path),  # Use absolute path to store the full file path
+    )
+    cursor.execute(sql, values)
+
+ASSET_TABLES = [
+    ('asset_item', ASSET_ITEM_COLUMNS),
+    ('asset_account', ASSET_ACCOUNT_COLUMNS),
+    ('asset_transaction', ASSET_TRANSACTION_COLUMNS),
+    ('asset_historical_balance', HISTORICAL_BALANCE_COLUMNS),
+]
+
+# Primary key of each table, used to skip rows already imported. Historical balances have a
+# surrogate key, so they are always inserted.
+ASSET_TABLE_KEYS = {
+    'asset_item': 'item_id',
+    'asset_account': 'account_id',
+    'asset_transaction': 'transaction_id',
+    'asset_historical_balance': None,
+}
+
+def column_list(columns):
+    return ", ".join(f"`{column}`" for column in columns)
+
+def create_staging_table(cursor, table, columns):
+    # The staging table has no keys, so duplicates within the file cannot fail the load itself
+    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS staging_{table}")
+    cursor.execute(f"CREATE TEMPORARY TABLE staging_{table} AS SELECT {column_list(columns)} FROM {table} LIMIT 0")
+
+def merge_staging_table(cursor, table, columns, staged):
+    # Rows whose key is already in the table are skipped, like the duplicate entries of the
+    # row-by-row path. Any other error (bad values, a missing foreign key, a key repeated within
+    # the file) fails the merge instead of being hidden by INSERT IGNORE.
+    key = ASSET_TABLE_KEYS[table]
+    staged_columns = ", ".join(f"s.`{column}`" for column in columns)
+    sql = f"INSERT INTO {table} ({column_list(columns)}) SELECT {staged_columns} FROM staging_{table} s"
+    if key:
+        sql += f" LEFT JOIN {table} t ON t.`{key}` = s.`{key}` WHERE t.`{key}` IS NULL"
+    cursor.execute(sql)
+    inserted = cursor.rowcount
+    if staged - inserted:
+        logging.warning(f"Skipped {staged - inserted} rows already present in {table}")
+    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS staging_{table}")
+    return inserted
+
+# Function to insert a whole asset report on one connection and in one transaction.
+# Rows are staged in batches as the file is parsed and merged into the live tables at the end.
+def insert_asset_report_data(header, records, file_path):
+    asset_report_id = header['asset_report_id']
+    columns = dict(ASSET_TABLES)
+    batch_size = staging_batch_size()
+    buffers = {table: [] for table, _ in ASSET_TABLES}
+    staged = {table: 0 for table, _ in ASSET_TABLES}
+
+    def flush(table):
+        bulk_insert(cursor, f"staging_{table}", columns[table], buffers[table])
+        staged[table] += len(buffers[table])
+        buffers[table] = []
+
+    conn = get_db_connection()
+    cursor = retrying_cursor(conn)
     try:
-        cursor.execute(sql, values)
+        insert_asset_report(cursor, header, file_path)
+        for table, table_columns in ASSET_TABLES:
+            create_staging_table(cursor, table, table_columns)
+
+        for kind, item, account in records:
+            if kind == 'item':
+                buffers['asset_item'].append(asset_item_row(item, asset_report_id))
+            else:
+                buffers['asset_account'].append(asset_account_row(account, item['item_id'], asset_report_id))
+                buffers['asset_transaction'].extend(asset_transaction_row(transaction, asset_report_id) for transaction in account['transactions'])
+                buffers['asset_historical_balance'].extend(historical_balance_row(balance, account['account_id'], asset_report_id) for balance in account['historical_balances'])
+
+            for table in buffers:
+                if len(buffers[table]) >= batch_size:
+                    flush(table)
+
+        counts = {}
+        for table, table_columns in ASSET_TABLES:
+            flush(table)
+            counts[table] = merge_staging_table(cursor, table, table_columns, staged[table])
         conn.commit()
-        print("Historical balance inserted successfully!")
-    except IntegrityError as e:
-        logging.error(f"Duplicate entry for historical balance for account: {account_id} on date: {balance['date']} - {e}")
-        print(f"Duplicate entry for historical balance for account: {account_id} on date: {balance['date']} - {e}")
+    except Exception:
+        conn.rollback()
+        raise
     finally:
         cursor.close()
         conn.close()
 
+    summary = ", ".join(f"{table}: {count}" for table, count in counts.items())
+    logging.info(f"Asset report inserted successfully: {asset_report_id} from file {file_path} ({summary})")
+    print(f"Asset report inserted successfully: {asset_report_id} ({summary})")
+
 # Function to process the JSON file and insert data into the database
 def process_json_file(filepath):
     logging.info(f"Loading file: {filepath}")
     print(f"Loading file: {filepath}")
-    
+
     if not os.path.exists(filepath):
         logging.error(f"File not found: {filepath}")
         print(f"File not found: {filepath}")
@@ -221,33 +255,10 @@ def process_json_file(filepath):
         print(f"File already inserted. Skipping: {filepath}")
         return
 
-    with open(filepath, 'r') as file:
-        data = json.load(file)
-        report = data['report']
-
-        logging.info("Inserting asset report")
-        print("Inserting asset report")
-        insert_asset_report(report, filepath)
-
-        logging.info("Inserting items")
-        print("Inserting items")
-        for item in report['items']:
-            insert_item(item, report['asset_report_id'])
-
-            logging.info("Inserting accounts")
-            print("Inserting accounts")
-            for account in item['accounts']:
-                insert_account(account, item['item_id'], report['asset_report_id'])
-
-                logging.info("Inserting transactions")
-                print("Inserting transactions")
-                for transaction in account['transactions']:
-                    insert_transaction(transaction, report['asset_report_id'])
-
-                logging.info("Inserting historical balances")
-                print("Inserting historical balances")
-                for balance in account['historical_balances']:
-                    insert_historical_balance(balance, account['account_id'], report['asset_report_id'])
+    # The file is parsed incrementally: one pass for the report's fields, one for its rows
+    header = read_report_header(filepath)
+    insert_asset_report_data(header, iter_report_accounts(filepath), filepath)
+    return True
 
 # Main function to iterate through JSON files in the specified directory
 def main():
@@ -260,6 +271,9 @@ def main():
                 process_json_file(filepath)
                 logging.info(f'Successfully processed file: {os.path.abspath(filepath)}')
                 print(f'Successfully processed file: {os.path.abspath(filepath)}')
+            except JSONError as e:
+                logging.error(f"Error decoding JSON from file {os.path.abspath(filepath)}: {e}")
+                print(f"Error decoding JSON from file {os.path.abspath(filepath)}: {e}")
             except IntegrityError as e:
                 logging.error(f"Duplicate entry found when processing file {os.path.abspath(filepath)}: {e}")
                 print(f"Duplicate entry found when processing file {os.path.abspath(filepath)}: {e}")
@@ -268,4 +282,5 @@ def main():
                 print(f'Error processing file {os.path.abspath(filepath)}: {e}')
 
 if __name__ == "__main__":
+    setup_logging('insert_assets')
     main()
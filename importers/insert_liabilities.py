@@ -1,157 +1,177 @@
 import os
-import json
+import sys
 import logging
-from mysql.connector import pooling
-from urllib.parse import urlparse
 from datetime import datetime
-from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv()
-
-MYSQL_URL = os.getenv("MYSQL_URL")
-MYSQL_USER = os.getenv("MYSQL_USER")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
-
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'insert_liabilities_{today}.log'),
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
-
-dbconfig = {
-    "host": urlparse(MYSQL_URL).hostname,
-    "port": urlparse(MYSQL_URL).port if urlparse(MYSQL_URL).port else 3306,
-    "user": MYSQL_USER,
-    "password": MYSQL_PASSWORD,
-    "database": urlparse(MYSQL_URL).path.lstrip('/')
-}
-
-connection_pool = pooling.MySQLConnectionPool(pool_name="mypool", pool_size=5, **dbconfig)
-
-def get_db_connection():
-    return connection_pool.get_connection()
-
-def is_file_imported(file_name):
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.db import get_db_connection, retrying_cursor, database_time, StatementCache
+from utils.json_stream import read_json_object
+from utils.import_ledger import check_file, get_import_ledger
+from utils.import_tracker import start_file_import, save_checkpoint, import_in_chunks, require_fields
+from utils.settings import get_settings, setup_logging
+from importers.insert_transactions import row_hash
+
+def read_liabilities_file(file_path):
+    # Credit liabilities are streamed from the file as they are inserted
+    return read_json_object(file_path, array_keys=('credit',))
+
+# Fields upsert_credit reads without a default; a record missing one is quarantined
+REQUIRED_CREDIT_FIELDS = [
+    'account_id', 'is_overdue', 'last_payment_amount', 'last_payment_date', 'last_statement_issue_date',
+    'last_statement_balance', 'minimum_payment_amount', 'next_payment_due_date', 'aprs'
+]
+REQUIRED_APR_FIELDS = ['apr_percentage', 'apr_type', 'balance_subject_to_apr', 'interest_charge_amount']
+
+def validate_credit(credit):
+    require_fields(credit, REQUIRED_CREDIT_FIELDS, 'credit')
+    for apr in credit['aprs'] or []:
+        require_fields(apr, REQUIRED_APR_FIELDS, f"credit {credit['account_id']} APR")
+
+def upsert_credit(statements, credit, tracker_id, version_time):
+    # Returns False when the credit and its APRs match the stored version, which is then left as is
+    validate_credit(credit)
+    transaction_id = credit['account_id']  # Assuming transaction_id is mapped from account_id or similar
+
+    is_overdue = credit['is_overdue']
+    last_payment_amount = credit['last_payment_amount']
+    last_payment_date = credit['last_payment_date']
+    last_statement_issue_date = credit['last_statement_issue_date']
+    last_statement_balance = credit['last_statement_balance']
+    minimum_payment_amount = credit['minimum_payment_amount']
+    next_payment_due_date = credit['next_payment_due_date']
+    values = (
+        transaction_id, is_overdue, last_payment_amount, last_payment_date,
+        last_statement_issue_date, last_statement_balance,
+        minimum_payment_amount, next_payment_due_date
+    )
+    aprs = [
+        (apr['apr_percentage'], apr['apr_type'], apr['balance_subject_to_apr'], apr['interest_charge_amount'])
+        for apr in credit['aprs'] or []
+    ]
+    # The APRs are versioned as a set with their credit row, so they are part of its hash
+    credit_hash = row_hash([values, sorted(aprs, key=str)])
+
+    # Check if transaction exists, and whether it changed
+    rows = statements.execute("SELECT row_hash FROM plaid_liabilities_credit WHERE account_id = %s", (transaction_id,)).fetchall()
+    transaction_exists = bool(rows)
+    if transaction_exists and rows[0][0] == credit_hash:
+        return False
+
+    # With HISTORY_MODE=scd2 the credit row is updated in place instead of deleted and re-inserted
+    update_in_place = transaction_exists and get_settings().history_mode == 'scd2'
+
+    if transaction_exists:
+        # Move existing data to history table, closing the version at version_time
+        statements.execute("""
+            INSERT INTO plaid_liabilities_credit_history (account_id, is_overdue, last_payment_amount, last_payment_date, 
+                last_statement_issue_date, last_statement_balance, minimum_payment_amount, next_payment_due_date, row_hash,
+                file_import_id, valid_from, valid_to)
+            SELECT account_id, is_overdue, last_payment_amount, last_payment_date, last_statement_issue_date, last_statement_balance, 
+                minimum_payment_amount, next_payment_due_date, row_hash, %s, valid_from, %s
+            FROM plaid_liabilities_credit WHERE account_id = %s
+        """, (tracker_id, version_time, transaction_id))
+        statements.execute("""
+            INSERT INTO plaid_liabilities_credit_apr_history (account_id, apr_percentage, apr_type, balance_subject_to_apr, 
+                interest_charge_amount, file_import_id, valid_from, valid_to)
+            SELECT account_id, apr_percentage, apr_type, balance_subject_to_apr, interest_charge_amount, %s, valid_from, %s
+            FROM plaid_liabilities_credit_apr WHERE account_id = %s
+        """, (tracker_id, version_time, transaction_id))
+
+        # Delete existing data; the APRs are versioned as a set with their credit row
+        statements.execute("DELETE FROM plaid_liabilities_credit_apr WHERE account_id = %s", (transaction_id,))
+        if not update_in_place:
+            statements.execute("DELETE FROM plaid_liabilities_credit WHERE account_id = %s", (transaction_id,))
+
+    if update_in_place:
+        statements.execute("""
+            UPDATE plaid_liabilities_credit SET
+                is_overdue = %s, last_payment_amount = %s, last_payment_date = %s,
+                last_statement_issue_date = %s, last_statement_balance = %s,
+                minimum_payment_amount = %s, next_payment_due_date = %s, row_hash = %s,
+                file_import_id = %s, valid_from = %s
+            WHERE account_id = %s
+        """, values[1:] + (credit_hash, tracker_id, version_time, transaction_id))
+    else:
+        statements.execute("""
+            INSERT INTO plaid_liabilities_credit (
+                account_id, is_overdue, last_payment_amount, last_payment_date, 
+                last_statement_issue_date, last_statement_balance, 
+                minimum_payment_amount, next_payment_due_date, row_hash, file_import_id, valid_from
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, values + (credit_hash, tracker_id, version_time))
+
+    for apr_percentage, apr_type, balance_subject_to_apr, interest_charge_amount in aprs:
+        statements.execute("""
+            INSERT INTO plaid_liabilities_credit_apr (
+                account_id, apr_percentage, apr_type, 
+                balance_subject_to_apr, interest_charge_amount, file_import_id, valid_from
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, (
+            transaction_id, apr_percentage, apr_type, 
+            balance_subject_to_apr, interest_charge_amount, tracker_id, version_time
+        ))
+    return True
+
+def insert_liabilities(data, bank_name, file_name, content_hash=None):
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM file_import_tracker WHERE file_name = %s", (file_name,))
-    result = cursor.fetchone()[0]
-    cursor.close()
-    conn.close()
-    return result > 0
-
-def insert_liabilities(data, bank_name, file_name):
-    if is_file_imported(file_name):
-        message = f"File {file_name} has already been imported. Skipping..."
-        print(message)
-        logging.info(message)
-        return
-    
+    cursor = retrying_cursor(conn)
+    statements = StatementCache(conn)  # Each per-credit statement is parsed once per file
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         description = f"Liabilities data for {bank_name} fetched at {timestamp}"
 
-        # Insert record in file_import_tracker
-        cursor.execute("""
-            INSERT INTO file_import_tracker (file_name, description) 
-            VALUES (%s, %s)
-        """, (file_name, description))
-
-        tracker_id = cursor.lastrowid
-
-        for credit in data['credit']:
-            transaction_id = credit['account_id']  # Assuming transaction_id is mapped from account_id or similar
-            
-            # Check if transaction exists
-            cursor.execute("SELECT COUNT(*) FROM plaid_liabilities_credit WHERE account_id = %s", (transaction_id,))
-            transaction_exists = cursor.fetchone()[0] > 0
-
-            if transaction_exists:
-                # Move existing data to history table
-                cursor.execute("""
-                    INSERT INTO plaid_liabilities_credit_history (account_id, is_overdue, last_payment_amount, last_payment_date, 
-                        last_statement_issue_date, last_statement_balance, minimum_payment_amount, next_payment_due_date, file_import_id)
-                    SELECT account_id, is_overdue, last_payment_amount, last_payment_date, last_statement_issue_date, last_statement_balance, 
-                        minimum_payment_amount, next_payment_due_date, %s 
-                    FROM plaid_liabilities_credit WHERE account_id = %s
-                """, (tracker_id, transaction_id))
-                cursor.execute("""
-                    INSERT INTO plaid_liabilities_credit_apr_history (account_id, apr_percentage, apr_type, balance_subject_to_apr, 
-                        interest_charge_amount, file_import_id)
-                    SELECT account_id, apr_percentage, apr_type, balance_subject_to_apr, interest_charge_amount, %s 
-                    FROM plaid_liabilities_credit_apr WHERE account_id = %s
-                """, (tracker_id, transaction_id))
-
-                # Delete existing data
-                cursor.execute("DELETE FROM plaid_liabilities_credit_apr WHERE account_id = %s", (transaction_id,))
-                cursor.execute("DELETE FROM plaid_liabilities_credit WHERE account_id = %s", (transaction_id,))
-
-            is_overdue = credit['is_overdue']
-            last_payment_amount = credit['last_payment_amount']
-            last_payment_date = credit['last_payment_date']
-            last_statement_issue_date = credit['last_statement_issue_date']
-            last_statement_balance = credit['last_statement_balance']
-            minimum_payment_amount = credit['minimum_payment_amount']
-            next_payment_due_date = credit['next_payment_due_date']
-
-            cursor.execute("""
-                INSERT INTO plaid_liabilities_credit (
-                    account_id, is_overdue, last_payment_amount, last_payment_date, 
-                    last_statement_issue_date, last_statement_balance, 
-                    minimum_payment_amount, next_payment_due_date, file_import_id
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                transaction_id, is_overdue, last_payment_amount, last_payment_date,
-                last_statement_issue_date, last_statement_balance, 
-                minimum_payment_amount, next_payment_due_date, tracker_id
-            ))
-
-            for apr in credit['aprs']:
-                apr_percentage = apr['apr_percentage']
-                apr_type = apr['apr_type']
-                balance_subject_to_apr = apr['balance_subject_to_apr']
-                interest_charge_amount = apr['interest_charge_amount']
-
-                cursor.execute("""
-                    INSERT INTO plaid_liabilities_credit_apr (
-                        account_id, apr_percentage, apr_type, 
-                        balance_subject_to_apr, interest_charge_amount, file_import_id
-                    )
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (
-                    transaction_id, apr_percentage, apr_type, 
-                    balance_subject_to_apr, interest_charge_amount, tracker_id
-                ))
+        # Insert or resume the record in file_import_tracker
+        checkpoint = start_file_import(cursor, file_name, description, content_hash)
+        if checkpoint is None:
+            message = f"File {file_name} has already been imported. Skipping..."
+            print(message)
+            logging.info(message)
+            return
+        tracker_id, start = checkpoint
+        conn.commit()
+        version_time = database_time(statements)
+
+        def process(cursor, credits):
+            written = sum(upsert_credit(statements, credit, tracker_id, version_time) for credit in credits)
+            return {'credits': written, 'unchanged': len(credits) - written}
+
+        records, counts = import_in_chunks(conn, cursor, data['credit'], tracker_id, file_name, process, start=start)
 
+        save_checkpoint(cursor, tracker_id, records, status='complete')
         conn.commit()
-        message = f"Successfully inserted liabilities for {bank_name} from {file_name}"
+        get_import_ledger().add(file_name, content_hash)
+        message = (f"Successfully inserted liabilities for {bank_name} from {file_name}. "
+                   f"Credits: {counts.get('credits', 0)}, unchanged: {counts.get('unchanged', 0)}, quarantined: {counts['quarantined']}")
         print(message)
         logging.info(message)
+        return counts
     except Exception as e:
         conn.rollback()
         message = f"Error inserting liabilities for {bank_name} from {file_name}: {e}"
         print(message)
         logging.error(message)
+        raise
     finally:
+        statements.close()
         cursor.close()
         conn.close()
 
 if __name__ == "__main__":
+    setup_logging('insert_liabilities')
     fetched_files_dir = 'data/fetched-files'
     for file_name in os.listdir(fetched_files_dir):
         if file_name.startswith('plaid_liabilities_') and file_name.endswith('.json'):
             bank_name = file_name.split('_')[2]  # Assuming the file name format is consistent
-            with open(os.path.join(fetched_files_dir, file_name), 'r') as file:
-                liabilities_data = json.load(file)
-            insert_liabilities(liabilities_data, bank_name, file_name)
+            file_path = os.path.join(fetched_files_dir, file_name)
+            content_hash = check_file(file_path, file_name)
+            if not content_hash:
+                continue
+            try:
+                insert_liabilities(read_liabilities_file(file_path), bank_name, file_name, content_hash)
+            except Exception:
+                continue  # Already logged and rolled back; go on with the next file
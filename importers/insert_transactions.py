@@ -1,265 +1,567 @@
 import os
+import sys
 import json
+import hashlib
 import logging
 import mysql.connector
-from mysql.connector import pooling
-from urllib.parse import urlparse
-from datetime import datetime
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-MYSQL_URL = os.getenv("MYSQL_URL")
-MYSQL_USER = os.getenv("MYSQL_USER")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
-
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'insert_transactions_{today}.log'),
-    level=logging.DEBUG,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
-
-dbconfig = {
-    "host": urlparse(MYSQL_URL).hostname,
-    "port": urlparse(MYSQL_URL).port if urlparse(MYSQL_URL).port else 3306,
-    "user": MYSQL_USER,
-    "password": MYSQL_PASSWORD,
-    "database": urlparse(MYSQL_URL).path.lstrip('/')
-}
-
-connection_pool = pooling.MySQLConnectionPool(pool_name="mypool", pool_size=5, **dbconfig)
-
-def get_db_connection():
-    return connection_pool.get_connection()
-
-def is_file_imported(file_name):
+from datetime import datetime, timedelta
+from itertools import chain
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.ndjson import read_ndjson
+from utils.json_stream import JSONError, iter_json_items, read_json_object
+from utils.db import get_db_connection, bulk_insert, staging_batch_size, retrying_cursor, database_time, StatementCache
+from utils.import_ledger import check_file, get_import_ledger
+from utils.counterparty_cache import CounterpartyCache
+from utils.category_cache import get_category_cache
+from utils.import_tracker import start_file_import, save_checkpoint, import_in_chunks, add_counts, require_fields, InvalidRecord
+from utils.settings import get_settings, setup_logging
+
+TRANSACTION_COLUMNS = [
+    'account_id', 'transaction_id', 'account_owner', 'amount',
+    'authorized_date', 'authorized_datetime', 'date', 'datetime',
+    'iso_currency_code', 'logo_url', 'merchant_entity_id', 'merchant_name',
+    'name', 'payment_channel', 'pending', 'pending_transaction_id',
+    'transaction_code', 'transaction_type', 'unofficial_currency_code',
+    'category', 'category_id', 'personal_finance_category_confidence_level',
+    'personal_finance_category_detailed', 'personal_finance_category_primary',
+    'personal_finance_category_icon_url', 'location_address',
+    'location_city', 'location_region', 'location_postal_code',
+    'location_country', 'location_lat', 'location_lon', 'location_store_number',
+    'payment_meta_reference_number', 'payment_meta_ppd_id',
+    'payment_meta_payee', 'payment_meta_by_order_of', 'payment_meta_payer',
+    'payment_meta_payment_method', 'payment_meta_payment_processor',
+    'payment_meta_reason', 'website', 'check_number', 'category_key', 'row_hash', 'file_import_id'
+]
+
+# plaid_transaction_counterparties links a transaction to a row of the counterparties dimension
+# (migration 004), which holds each counterparty's attributes once
+COUNTERPARTY_COLUMNS = [
+    'transaction_id', 'counterparty_key', 'confidence_level', 'row_hash', 'file_import_id'
+]
+COUNTERPARTY_ATTRIBUTES = ['entity_id', 'name', 'type', 'website', 'logo_url', 'phone_number']
+# Staged links also carry the attributes, filled in only when the dimension row has to be written
+STAGED_COUNTERPARTY_COLUMNS = COUNTERPARTY_COLUMNS + COUNTERPARTY_ATTRIBUTES + ['has_attributes']
+COUNTERPARTY_HASH = COUNTERPARTY_COLUMNS.index('row_hash')
+
+# Fields transaction_row reads without a default; a record missing one is quarantined
+REQUIRED_TRANSACTION_FIELDS = [
+    'account_id', 'transaction_id', 'amount', 'date', 'iso_currency_code', 'name',
+    'payment_channel', 'pending', 'transaction_type', 'category', 'category_id'
+]
+
+def validate_transaction(transaction):
+    require_fields(transaction, REQUIRED_TRANSACTION_FIELDS, 'transaction')
+    if not isinstance(transaction['category'], list):
+        raise InvalidRecord(f"transaction {transaction['transaction_id']} category is not a list")
+    for counterparty in transaction.get('counterparties') or []:
+        if not isinstance(counterparty, dict):
+            raise InvalidRecord(f"transaction {transaction['transaction_id']} has a counterparty that is not an object")
+
+def column_list(columns, prefix=''):
+    return ", ".join(f"{prefix}{column}" for column in columns)
+
+# History rows also record when the version was current: from the live row's valid_from
+# until the time it was replaced or removed
+HISTORY_COLUMNS = TRANSACTION_COLUMNS + ['valid_from', 'valid_to']
+
+def history_values(prefix=''):
+    # Select list copying a live row to history; parameters are the file import and valid_to
+    return f"{column_list(TRANSACTION_COLUMNS[:-1], prefix)}, %s, {prefix}valid_from, %s"
+
+def row_hash(values):
+    # Stable fingerprint of a row's content; file_import_id is excluded so re-imports hash the same
+    return hashlib.md5(json.dumps(values, default=str).encode('utf-8')).hexdigest()
+
+def archive_transactions(statements, transaction_ids, tracker_id, version_time):
+    placeholders = ", ".join(["%s"] * len(transaction_ids))
+
+    # Move existing data to history table
+    statements.execute(f"""
+        INSERT INTO plaid_transactions_history ({column_list(HISTORY_COLUMNS)})
+        SELECT {history_values()}
+        FROM plaid_transactions WHERE transaction_id IN ({placeholders})
+    """, (tracker_id, version_time, *transaction_ids))
+
+    statements.execute(f"""
+        INSERT INTO plaid_transaction_counterparties_history ({column_list(COUNTERPARTY_COLUMNS)})
+        SELECT {column_list(COUNTERPARTY_COLUMNS[:-1])}, %s
+        FROM plaid_transaction_counterparties WHERE transaction_id IN ({placeholders})
+    """, (tracker_id, *transaction_ids))
+
+    # Delete existing data
+    statements.execute(f"DELETE FROM plaid_transaction_counterparties WHERE transaction_id IN ({placeholders})", tuple(transaction_ids))
+    statements.execute(f"DELETE FROM plaid_transactions WHERE transaction_id IN ({placeholders})", tuple(transaction_ids))
+
+def transaction_row(transaction, tracker_id, counterparties=()):
+    location = transaction.get('location') or {}
+    payment_meta = transaction.get('payment_meta') or {}
+    personal_finance_category = transaction.get('personal_finance_category') or {}
+    values = (
+        transaction['account_id'],
+        transaction['transaction_id'],
+        transaction.get('account_owner', None),
+        transaction['amount'],
+        transaction.get('authorized_date', None),
+        transaction.get('authorized_datetime', None),
+        transaction['date'],
+        transaction.get('datetime', None),
+        transaction['iso_currency_code'],
+        transaction.get('logo_url', None),
+        transaction.get('merchant_entity_id', None),
+        transaction.get('merchant_name', None),
+        transaction['name'],
+        transaction['payment_channel'],
+        transaction['pending'],
+        transaction.get('pending_transaction_id', None),
+        transaction.get('transaction_code', None),
+        transaction['transaction_type'],
+        transaction.get('unofficial_currency_code', None),
+        ", ".join(transaction['category']),
+        transaction['category_id'],
+        personal_finance_category.get('confidence_level', None),
+        personal_finance_category.get('detailed', None),
+        personal_finance_category.get('primary', None),
+        transaction.get('personal_finance_category_icon_url', None),
+        location.get('address', None),
+        location.get('city', None),
+        location.get('region', None),
+        location.get('postal_code', None),
+        location.get('country', None),
+        location.get('lat', None),
+        location.get('lon', None),
+        location.get('store_number', None),
+        payment_meta.get('reference_number', None),
+        payment_meta.get('ppd_id', None),
+        payment_meta.get('payee', None),
+        payment_meta.get('by_order_of', None),
+        payment_meta.get('payer', None),
+        payment_meta.get('payment_method', None),
+        payment_meta.get('payment_processor', None),
+        payment_meta.get('reason', None),
+        transaction.get('website', None),
+        transaction.get('check_number', None),
+    )
+    # A change in any counterparty also changes the transaction's hash. category_key is derived
+    # from category_id and left out of the hash, so it can be resolved after the row is stored.
+    counterparty_hashes = sorted(counterparty[COUNTERPARTY_HASH] for counterparty in counterparties)
+    category_key = get_category_cache().category_key(transaction['category_id'])
+    return values + (category_key, row_hash([values, counterparty_hashes]), tracker_id)
+
+def counterparty_key(counterparty):
+    # Plaid's entity_id identifies a counterparty across transactions; without one, its name and type do.
+    # Migration 004 computes the same key in SQL for the existing rows.
+    if counterparty.get('entity_id'):
+        identity = f"entity:{counterparty['entity_id']}"
+    else:
+        identity = f"name:{(counterparty.get('name') or '').strip(' ').lower()}|{counterparty.get('type') or ''}"
+    return hashlib.md5(identity.encode('utf-8')).hexdigest()
+
+def counterparty_rows(transaction, tracker_id, cache):
+    rows = []
+    for counterparty in transaction.get('counterparties') or []:
+        values = (
+            transaction['transaction_id'],
+            counterparty.get('name', None),
+            counterparty.get('type', None),
+            counterparty.get('website', None),
+            counterparty.get('logo_url', None),
+            counterparty.get('confidence_level', None),
+            counterparty.get('entity_id', None),
+            counterparty.get('phone_number', None),
+        )
+        # The hash still covers every field, so the transaction hashes did not change with the dimension
+        key = counterparty_key(counterparty)
+        attributes = tuple(counterparty.get(attribute, None) for attribute in COUNTERPARTY_ATTRIBUTES)
+        has_attributes = cache.needs_write(key, attributes)
+        if not has_attributes:
+            attributes = (None,) * len(COUNTERPARTY_ATTRIBUTES)
+        rows.append((transaction['transaction_id'], key, counterparty.get('confidence_level', None),
+                     row_hash(values), tracker_id) + attributes + (has_attributes,))
+    return rows
+
+def create_staging_tables(cursor):
+    # Temporary tables are private to this connection. LIKE copies the columns and
+    # indexes (including the unique transaction_id) but not the foreign keys.
+    # They are created once per file: DDL on a table makes the server re-prepare every
+    # prepared statement that uses it, so between chunks they are only emptied.
+    drop_staging_tables(cursor)
+    cursor.execute("CREATE TEMPORARY TABLE staging_transactions LIKE plaid_transactions")
+    cursor.execute("CREATE TEMPORARY TABLE staging_transaction_counterparties LIKE plaid_transaction_counterparties")
+    cursor.execute("""
+        ALTER TABLE staging_transaction_counterparties
+            ADD COLUMN entity_id VARCHAR(255),
+            ADD COLUMN name VARCHAR(255),
+            ADD COLUMN type VARCHAR(50),
+            ADD COLUMN website VARCHAR(255),
+            ADD COLUMN logo_url VARCHAR(255),
+            ADD COLUMN phone_number VARCHAR(50),
+            ADD COLUMN has_attributes BOOLEAN NOT NULL DEFAULT FALSE
+    """)
+
+def drop_staging_tables(cursor):
+    cursor.execute("DROP TEMPORARY TABLE IF EXISTS staging_transactions")
+    cursor.execute("DROP TEMPORARY TABLE IF EXISTS staging_transaction_counterparties")
+
+def clear_staging_tables(statements):
+    statements.execute("DELETE FROM staging_transaction_counterparties")
+    statements.execute("DELETE FROM staging_transactions")
+
+def flush_staging_batch(cursor, transaction_rows, counterparty_rows):
+    # Staged rows go out as multi-row INSERTs on the plain cursor: one statement per batch
+    # already costs a single parse, where a prepared cursor would send one execute per row
+    bulk_insert(cursor, 'staging_transactions', TRANSACTION_COLUMNS, transaction_rows)
+    bulk_insert(cursor, 'staging_transaction_counterparties', STAGED_COUNTERPARTY_COLUMNS, counterparty_rows)
+
+def unstage_transaction(statements, transaction_id):
+    statements.execute("DELETE FROM staging_transaction_counterparties WHERE transaction_id = %s", (transaction_id,))
+    statements.execute("DELETE FROM staging_transactions WHERE transaction_id = %s", (transaction_id,))
+
+def upsert_staged_counterparties(statements):
+    # Writes the dimension rows the cache asked for, before unchanged transactions are discarded,
+    # so every key the cache records as written is written in this transaction
+    attributes = ", ".join(f"{attribute} = VALUES({attribute})" for attribute in COUNTERPARTY_ATTRIBUTES)
+    return statements.execute(f"""
+        INSERT INTO counterparties (counterparty_key, {column_list(COUNTERPARTY_ATTRIBUTES)})
+        SELECT counterparty_key, {column_list(COUNTERPARTY_ATTRIBUTES)}
+        FROM staging_transaction_counterparties WHERE has_attributes
+        ON DUPLICATE KEY UPDATE {attributes}
+    """).rowcount
+
+def stage_transactions(cursor, statements, transactions, tracker_id, counterparties, batch_size=None):
+    batch_size = batch_size or staging_batch_size()
+    staged_ids = set()
+    transaction_batch, counterparty_batch = [], []
+
+    for transaction in transactions:
+        validate_transaction(transaction)
+        transaction_id = transaction['transaction_id']
+        if transaction_id in staged_ids:
+            # A transaction repeated in one file keeps its last version, as it did row by row
+            flush_staging_batch(cursor, transaction_batch, counterparty_batch)
+            transaction_batch, counterparty_batch = [], []
+            upsert_staged_counterparties(statements)  # Dimension rows the replaced version was carrying
+            unstage_transaction(statements, transaction_id)
+        staged_ids.add(transaction_id)
+        links = counterparty_rows(transaction, tracker_id, counterparties)
+        transaction_batch.append(transaction_row(transaction, tracker_id, links))
+        counterparty_batch.extend(links)
+
+        if len(transaction_batch) >= batch_size:
+            flush_staging_batch(cursor, transaction_batch, counterparty_batch)
+            transaction_batch, counterparty_batch = [], []
+
+    if transaction_batch:
+        flush_staging_batch(cursor, transaction_batch, counterparty_batch)
+    return len(staged_ids)
+
+def discard_unchanged_transactions(statements):
+    # Staged rows whose hash matches the stored row are dropped before the merge,
+    # so unchanged transactions are neither archived nor rewritten
+    statements.execute("""
+        DELETE sc FROM staging_transaction_counterparties sc
+        JOIN staging_transactions s ON s.transaction_id = sc.transaction_id
+        JOIN plaid_transactions t ON t.transaction_id = s.transaction_id AND t.row_hash = s.row_hash
+    """)
+    return statements.execute("""
+        DELETE s FROM staging_transactions s
+        JOIN plaid_transactions t ON t.transaction_id = s.transaction_id AND t.row_hash = s.row_hash
+    """).rowcount
+
+def archive_staged_versions(statements, tracker_id, version_time):
+    # Closes the current version of every staged transaction that is already stored,
+    # and replaces its counterparties, which are versioned as a set with the transaction
+    archived = statements.execute(f"""
+        INSERT INTO plaid_transactions_history ({column_list(HISTORY_COLUMNS)})
+        SELECT {history_values('t.')}
+        FROM plaid_transactions t
+        JOIN staging_transactions s ON s.transaction_id = t.transaction_id
+    """, (tracker_id, version_time)).rowcount
+
+    statements.execute(f"""
+        INSERT INTO plaid_transaction_counterparties_history ({column_list(COUNTERPARTY_COLUMNS)})
+        SELECT {column_list(COUNTERPARTY_COLUMNS[:-1], 'c.')}, %s
+        FROM plaid_transaction_counterparties c
+        JOIN staging_transactions s ON s.transaction_id = c.transaction_id
+    """, (tracker_id,))
+
+    statements.execute("""
+        DELETE c FROM plaid_transaction_counterparties c
+        JOIN staging_transactions s ON s.transaction_id = c.transaction_id
+    """)
+    return archived
+
+def insert_staged_counterparties(statements):
+    statements.execute(f"""
+        INSERT INTO plaid_transaction_counterparties ({column_list(COUNTERPARTY_COLUMNS)})
+        SELECT {column_list(COUNTERPARTY_COLUMNS)} FROM staging_transaction_counterparties
+    """)
+
+def merge_staged_transactions(statements, tracker_id, version_time):
+    # Replace every staged transaction in a fixed number of statements, whatever the file size:
+    # copy the current rows to history, delete them, then insert the staged versions.
+    archived = archive_staged_versions(statements, tracker_id, version_time)
+    statements.execute("""
+        DELETE t FROM plaid_transactions t
+        JOIN staging_transactions s ON s.transaction_id = t.transaction_id
+    """)
+
+    statements.execute(f"""
+        INSERT INTO plaid_transactions ({column_list(TRANSACTION_COLUMNS)}, valid_from)
+        SELECT {column_list(TRANSACTION_COLUMNS)}, %s FROM staging_transactions
+    """, (version_time,))
+    insert_staged_counterparties(statements)
+    return archived
+
+def update_staged_transactions(statements, tracker_id, version_time):
+    # HISTORY_MODE=scd2: changed transactions are updated in place, so a row keeps its id and only
+    # the closed version is written to history. Transactions not stored yet are inserted.
+    archived = archive_staged_versions(statements, tracker_id, version_time)
+    assignments = ", ".join(f"t.{column} = s.{column}" for column in TRANSACTION_COLUMNS if column != 'transaction_id')
+    statements.execute(f"""
+        UPDATE plaid_transactions t
+        JOIN staging_transactions s ON s.transaction_id = t.transaction_id
+        SET {assignments}, t.valid_from = %s
+    """, (version_time,))
+
+    statements.execute(f"""
+        INSERT INTO plaid_transactions ({column_list(TRANSACTION_COLUMNS)}, valid_from)
+        SELECT {column_list(TRANSACTION_COLUMNS, 's.')}, %s
+        FROM staging_transactions s
+        LEFT JOIN plaid_transactions t ON t.transaction_id = s.transaction_id
+        WHERE t.id IS NULL
+    """, (version_time,))
+    insert_staged_counterparties(statements)
+    return archived
+
+# Join clauses selecting pending rows (alias t) that a posted transaction has replaced. Plaid gives
+# the posted transaction a new transaction_id and points its pending_transaction_id at the pending one.
+SUPERSEDED_BY_STAGED_POSTED = """
+    JOIN staging_transactions s ON s.pending_transaction_id = t.transaction_id
+    WHERE t.pending = TRUE AND s.pending = FALSE
+"""
+SUPERSEDED_STAGED_PENDING = """
+    JOIN staging_transactions s ON s.transaction_id = t.transaction_id
+    JOIN plaid_transactions posted ON posted.pending_transaction_id = t.transaction_id
+    WHERE t.pending = TRUE AND posted.pending = FALSE
+"""
+SUPERSEDED_BY_POSTED = """
+    JOIN plaid_transactions posted ON posted.pending_transaction_id = t.transaction_id
+    WHERE t.pending = TRUE AND posted.pending = FALSE
+"""
+STALE_PENDING = """
+    WHERE t.pending = TRUE AND t.date < %s
+"""
+
+def archive_matching_transactions(statements, match, tracker_id, version_time, params=()):
+    # Moves the live transactions selected by match, and their counterparties, to history in bulk
+    archived = statements.execute(f"""
+        INSERT INTO plaid_transactions_history ({column_list(HISTORY_COLUMNS)})
+        SELECT DISTINCT {history_values('t.')}
+        FROM plaid_transactions t {match}
+    """, (tracker_id, version_time, *params)).rowcount
+    if not archived:
+        return 0
+
+    statements.execute(f"""
+        INSERT INTO plaid_transaction_counterparties_history ({column_list(COUNTERPARTY_COLUMNS)})
+        SELECT DISTINCT {column_list(COUNTERPARTY_COLUMNS[:-1], 'c.')}, %s
+        FROM plaid_transaction_counterparties c
+        JOIN plaid_transactions t ON t.transaction_id = c.transaction_id {match}
+    """, (tracker_id, *params))
+    statements.execute(f"""
+        DELETE c FROM plaid_transaction_counterparties c
+        JOIN plaid_transactions t ON t.transaction_id = c.transaction_id {match}
+    """, params)
+    statements.execute(f"DELETE t FROM plaid_transactions t {match}", params)
+    return archived
+
+def reconcile_pending_transactions(statements, tracker_id, version_time):
+    # Archives the pending rows superseded by this chunk: pending rows whose posted version was just
+    # staged, and staged pending rows whose posted version is already stored (files applied out of order).
+    # The second lookup goes through the index on pending_transaction_id.
+    superseded = archive_matching_transactions(statements, SUPERSEDED_BY_STAGED_POSTED, tracker_id, version_time)
+    superseded += archive_matching_transactions(statements, SUPERSEDED_STAGED_PENDING, tracker_id, version_time)
+    return superseded
+
+def upsert_transactions(cursor, statements, transactions, tracker_id, version_time, counterparties):
+    # Returns counts of inserted, changed and unchanged transactions.
+    # The staging tables must exist (create_staging_tables); rows left by a failed chunk are cleared first.
+    # version_time is when the file's versions become current (and the versions they replace end).
+    # counterparties is the file's CounterpartyCache, committed and rolled back with each chunk.
+    clear_staging_tables(statements)
+    staged = stage_transactions(cursor, statements, transactions, tracker_id, counterparties)
+    upsert_staged_counterparties(statements)
+    unchanged = discard_unchanged_transactions(statements)
+    if get_settings().history_mode == 'scd2':
+        changed = update_staged_transactions(statements, tracker_id, version_time)
+    else:
+        changed = merge_staged_transactions(statements, tracker_id, version_time)
+    superseded = reconcile_pending_transactions(statements, tracker_id, version_time)
+    return {'inserted': staged - unchanged - changed, 'changed': changed, 'unchanged': unchanged, 'superseded': superseded}
+
+def remove_transactions(statements, transaction_ids, tracker_id, version_time, batch_size=500):
+    # Archive and delete removed transactions in batches rather than one round trip per ID
+    for i in range(0, len(transaction_ids), batch_size):
+        archive_transactions(statements, transaction_ids[i:i+batch_size], tracker_id, version_time)
+
+def compact_pending_transactions(stale_days=None):
+    # Periodic clean-up outside any file import: archives every pending row a posted transaction has
+    # replaced, and pending rows older than PENDING_STALE_DAYS that never posted (0 keeps them).
+    stale_days = get_settings().pending_stale_days if stale_days is None else stale_days
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM file_import_tracker WHERE file_name = %s", (file_name,))
-    result = cursor.fetchone()[0]
-    cursor.close()
-    conn.close()
-    return result > 0
-
-def insert_transactions(data, bank_name, file_name):
-    if is_file_imported(file_name):
-        message = f"File {file_name} has already been imported. Skipping..."
+    statements = StatementCache(conn)
+    try:
+        version_time = database_time(statements)
+        superseded = archive_matching_transactions(statements, SUPERSEDED_BY_POSTED, None, version_time)
+        stale = 0
+        if stale_days:
+            cutoff = (datetime.now() - timedelta(days=stale_days)).date()
+            stale = archive_matching_transactions(statements, STALE_PENDING, None, version_time, (cutoff,))
+        conn.commit()
+        message = f"Compacted pending transactions: {superseded} superseded, {stale} stale"
         print(message)
         logging.info(message)
-        return
-    
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        return {'superseded': superseded, 'stale': stale}
+    except Exception as e:
+        conn.rollback()
+        message = f"Error compacting pending transactions: {e}"
+        print(message)
+        logging.error(message)
+    finally:
+        statements.close()
+        conn.close()
 
+def read_sync_file(file_path):
+    # Added and modified transactions are streamed from the file as they are staged
+    return read_json_object(file_path, array_keys=('added', 'modified', 'removed'), scalar_keys=('token_id', 'cursor', 'next_cursor'))
+
+def update_transactions_cursor(cursor, data, bank_name):
+    # Advances the cursor of the item the file was fetched for, and only from the cursor the
+    # fetch started at: a sync file replayed after a newer one fails instead of moving the
+    # cursor backwards. Files written before token_id was recorded fall back to the bank name,
+    # which must then match a single item.
+    if data.get('token_id') is not None:
+        item = "token_id = %s"
+        params = (data['token_id'], data.get('cursor'))
+    else:
+        item = "bank_name = %s"
+        params = (bank_name, data.get('cursor'))
+    cursor.execute(f"""
+        UPDATE plaid_access_tokens SET transactions_cursor = %s
+        WHERE {item} AND transactions_cursor <=> %s
+    """, (data['next_cursor'], *params))
+    updated = cursor.rowcount
+    if updated == 0 and data['next_cursor'] == data.get('cursor'):
+        # A sync with no changes returns the cursor it started from, which updates no row
+        cursor.execute(f"SELECT COUNT(*) FROM plaid_access_tokens WHERE {item} AND transactions_cursor <=> %s", params)
+        updated = cursor.fetchall()[0][0]
+    if updated != 1:
+        raise RuntimeError(f"Transactions cursor for {bank_name} no longer matches the cursor this sync file "
+                           f"started from ({updated} items matched), fetch the changes again")
+
+def import_transaction_file(records, bank_name, file_name, content_hash, kind, finish=None):
+    # Imports one transactions file on its own connection: records are upserted in checkpointed
+    # chunks, then finish(cursor, statements, tracker_id, version_time), if given, runs in the same
+    # transaction as the completing checkpoint and returns any extra counts to report.
+    conn = get_db_connection()
+    cursor = retrying_cursor(conn)
+    statements = StatementCache(conn)  # Prepared once, reused by every chunk of the file
+    counterparties = CounterpartyCache()
+    try:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        description = f"Transactions data for {bank_name} fetched at {timestamp}"
-
-        # Insert record in file_import_tracker
-        cursor.execute("""
-            INSERT INTO file_import_tracker (file_name, description) 
-            VALUES (%s, %s)
-        """, (file_name, description))
-
-        tracker_id = cursor.lastrowid
-
-        for transaction in data:
-            transaction_id = transaction['transaction_id']
-
-            # Check if transaction exists
-            cursor.execute("SELECT COUNT(*) FROM plaid_transactions WHERE transaction_id = %s", (transaction_id,))
-            transaction_exists = cursor.fetchone()[0] > 0
-
-            if transaction_exists:
-                # Move existing data to history table
-                cursor.execute("""
-                    INSERT INTO plaid_transactions_history (
-                        account_id, transaction_id, account_owner, amount, 
-                        authorized_date, authorized_datetime, date, datetime, 
-                        iso_currency_code, logo_url, merchant_entity_id, merchant_name, 
-                        name, payment_channel, pending, pending_transaction_id, 
-                        transaction_code, transaction_type, unofficial_currency_code, 
-                        category, category_id, personal_finance_category_confidence_level, 
-                        personal_finance_category_detailed, personal_finance_category_primary, 
-                        personal_finance_category_icon_url, location_address, 
-                        location_city, location_region, location_postal_code, 
-                        location_country, location_lat, location_lon, location_store_number, 
-                        payment_meta_reference_number, payment_meta_ppd_id, 
-                        payment_meta_payee, payment_meta_by_order_of, payment_meta_payer, 
-                        payment_meta_payment_method, payment_meta_payment_processor, 
-                        payment_meta_reason, website, check_number, file_import_id
-                    )
-                    SELECT 
-                        account_id, transaction_id, account_owner, amount, 
-                        authorized_date, authorized_datetime, date, datetime, 
-                        iso_currency_code, logo_url, merchant_entity_id, merchant_name, 
-                        name, payment_channel, pending, pending_transaction_id, 
-                        transaction_code, transaction_type, unofficial_currency_code, 
-                        category, category_id, personal_finance_category_confidence_level, 
-                        personal_finance_category_detailed, personal_finance_category_primary, 
-                        personal_finance_category_icon_url, location_address, 
-                        location_city, location_region, location_postal_code, 
-                        location_country, location_lat, location_lon, location_store_number, 
-                        payment_meta_reference_number, payment_meta_ppd_id, 
-                        payment_meta_payee, payment_meta_by_order_of, payment_meta_payer, 
-                        payment_meta_payment_method, payment_meta_payment_processor, 
-                        payment_meta_reason, website, check_number, %s 
-                    FROM plaid_transactions WHERE transaction_id = %s
-                """, (tracker_id, transaction_id))
-
-                cursor.execute("""
-                    INSERT INTO plaid_transaction_counterparties_history (
-                        transaction_id, name, type, website, logo_url, 
-                        confidence_level, entity_id, phone_number, file_import_id
-                    )
-                    SELECT 
-                        transaction_id, name, type, website, logo_url, 
-                        confidence_level, entity_id, phone_number, %s 
-                    FROM plaid_transaction_counterparties WHERE transaction_id = %s
-                """, (tracker_id, transaction_id))
-
-                # Delete existing data
-                cursor.execute("DELETE FROM plaid_transaction_counterparties WHERE transaction_id = %s", (transaction_id,))
-                cursor.execute("DELETE FROM plaid_transactions WHERE transaction_id = %s", (transaction_id,))
-
-            params = {
-                'account_id': transaction['account_id'], 
-                'transaction_id': transaction['transaction_id'], 
-                'account_owner': transaction.get('account_owner', None), 
-                'amount': transaction['amount'],
-                'authorized_date': transaction.get('authorized_date', None), 
-                'authorized_datetime': transaction.get('authorized_datetime', None), 
-                'date': transaction['date'], 
-                'datetime': transaction.get('datetime', None),
-                'iso_currency_code': transaction['iso_currency_code'], 
-                'logo_url': transaction.get('logo_url', None), 
-                'merchant_entity_id': transaction.get('merchant_entity_id', None), 
-                'merchant_name': transaction.get('merchant_name', None),
-                'name': transaction['name'], 
-                'payment_channel': transaction['payment_channel'], 
-                'pending': transaction['pending'], 
-                'pending_transaction_id': transaction.get('pending_transaction_id', None),
-                'transaction_code': transaction.get('transaction_code', None), 
-                'transaction_type': transaction['transaction_type'], 
-                'unofficial_currency_code': transaction.get('unofficial_currency_code', None),
-                'category': ", ".join(transaction['category']), 
-                'category_id': transaction['category_id'], 
-                'personal_finance_category_confidence_level': transaction.get('personal_finance_category', {}).get('confidence_level', None),
-                'personal_finance_category_detailed': transaction.get('personal_finance_category', {}).get('detailed', None), 
-                'personal_finance_category_primary': transaction.get('personal_finance_category', {}).get('primary', None),
-                'personal_finance_category_icon_url': transaction.get('personal_finance_category_icon_url', None), 
-                'location_address': transaction['location'].get('address', None), 
-                'location_city': transaction['location'].get('city', None),
-                'location_region': transaction['location'].get('region', None), 
-                'location_postal_code': transaction['location'].get('postal_code', None), 
-                'location_country': transaction['location'].get('country', None),
-                'location_lat': transaction['location'].get('lat', None), 
-                'location_lon': transaction['location'].get('lon', None), 
-                'location_store_number': transaction['location'].get('store_number', None),
-                'payment_meta_reference_number': transaction['payment_meta'].get('reference_number', None), 
-                'payment_meta_ppd_id': transaction['payment_meta'].get('ppd_id', None),
-                'payment_meta_payee': transaction['payment_meta'].get('payee', None), 
-                'payment_meta_by_order_of': transaction['payment_meta'].get('by_order_of', None), 
-                'payment_meta_payer': transaction['payment_meta'].get('payer', None),
-                'payment_meta_payment_method': transaction['payment_meta'].get('payment_method', None), 
-                'payment_meta_payment_processor': transaction['payment_meta'].get('payment_processor', None),
-                'payment_meta_reason': transaction['payment_meta'].get('reason', None), 
-                'website': transaction.get('website', None), 
-                'check_number': transaction.get('check_number', None), 
-                'file_import_id': tracker_id
-            }
-
-            sql = """
-                INSERT INTO plaid_transactions (
-                    account_id, transaction_id, account_owner, amount, 
-                    authorized_date, authorized_datetime, date, datetime, 
-                    iso_currency_code, logo_url, merchant_entity_id, merchant_name, 
-                    name, payment_channel, pending, pending_transaction_id, 
-                    transaction_code, transaction_type, unofficial_currency_code, 
-                    category, category_id, personal_finance_category_confidence_level, 
-                    personal_finance_category_detailed, personal_finance_category_primary, 
-                    personal_finance_category_icon_url, location_address, 
-                    location_city, location_region, location_postal_code, 
-                    location_country, location_lat, location_lon, location_store_number, 
-                    payment_meta_reference_number, payment_meta_ppd_id, 
-                    payment_meta_payee, payment_meta_by_order_of, payment_meta_payer, 
-                    payment_meta_payment_method, payment_meta_payment_processor, 
-                    payment_meta_reason, website, check_number, file_import_id
-                ) VALUES (
-                    %(account_id)s, %(transaction_id)s, %(account_owner)s, %(amount)s, 
-                    %(authorized_date)s, %(authorized_datetime)s, %(date)s, %(datetime)s, 
-                    %(iso_currency_code)s, %(logo_url)s, %(merchant_entity_id)s, %(merchant_name)s, 
-                    %(name)s, %(payment_channel)s, %(pending)s, %(pending_transaction_id)s, 
-                    %(transaction_code)s, %(transaction_type)s, %(unofficial_currency_code)s, 
-                    %(category)s, %(category_id)s, %(personal_finance_category_confidence_level)s, 
-                    %(personal_finance_category_detailed)s, %(personal_finance_category_primary)s, 
-                    %(personal_finance_category_icon_url)s, %(location_address)s, 
-                    %(location_city)s, %(location_region)s, %(location_postal_code)s, 
-                    %(location_country)s, %(location_lat)s, %(location_lon)s, %(location_store_number)s, 
-                    %(payment_meta_reference_number)s, %(payment_meta_ppd_id)s, 
-                    %(payment_meta_payee)s, %(payment_meta_by_order_of)s, %(payment_meta_payer)s, 
-                    %(payment_meta_payment_method)s, %(payment_meta_payment_processor)s, 
-                    %(payment_meta_reason)s, %(website)s, %(check_number)s, %(file_import_id)s
-                )
-            """
-
-            cursor.execute(sql, params)
-
-            for counterparty in transaction.get('counterparties', []):
-                counterparty_params = {
-                    'transaction_id': transaction['transaction_id'],
-                    'name': counterparty.get('name', None),
-                    'type': counterparty.get('type', None),
-                    'website': counterparty.get('website', None),
-                    'logo_url': counterparty.get('logo_url', None),
-                    'confidence_level': counterparty.get('confidence_level', None),
-                    'entity_id': counterparty.get('entity_id', None),
-                    'phone_number': counterparty.get('phone_number', None),
-                    'file_import_id': tracker_id
-                }
-
-                counterparty_sql = """
-                    INSERT INTO plaid_transaction_counterparties (
-                        transaction_id, name, type, website, logo_url, 
-                        confidence_level, entity_id, phone_number, file_import_id
-                    ) VALUES (
-                        %(transaction_id)s, %(name)s, %(type)s, %(website)s, %(logo_url)s, 
-                        %(confidence_level)s, %(entity_id)s, %(phone_number)s, %(file_import_id)s
-                    )
-                """
-
-                cursor.execute(counterparty_sql, counterparty_params)
+        description = f"{kind.capitalize()} data for {bank_name} fetched at {timestamp}"
 
+        # Insert or resume the record in file_import_tracker
+        checkpoint = start_file_import(cursor, file_name, description, content_hash)
+        if checkpoint is None:
+            message = f"File {file_name} has already been imported. Skipping..."
+            print(message)
+            logging.info(message)
+            return
+        tracker_id, start = checkpoint
         conn.commit()
-        message = f"Successfully inserted transactions for {bank_name} from {file_name}"
+        if start:
+            logging.info(f"Resuming {file_name} after record {start}")
+        version_time = database_time(statements)
+
+        create_staging_tables(cursor)
+        imported, counts = import_in_chunks(
+            conn, cursor, records, tracker_id, file_name,
+            lambda cursor, chunk: upsert_transactions(cursor, statements, chunk, tracker_id, version_time, counterparties),
+            start=start, on_commit=counterparties.commit, on_rollback=counterparties.rollback
+        )
+        drop_staging_tables(cursor)
+
+        if finish:
+            add_counts(counts, finish(cursor, statements, tracker_id, version_time))
+        save_checkpoint(cursor, tracker_id, imported, status='complete')
+        conn.commit()
+        get_import_ledger().add(file_name, content_hash)
+        message = (f"Successfully imported {kind} for {bank_name} from {file_name}. "
+                   f"Inserted: {counts.get('inserted', 0)}, changed: {counts.get('changed', 0)}, "
+                   f"unchanged: {counts.get('unchanged', 0)}, superseded pending: {counts.get('superseded', 0)}, "
+                   + (f"removed: {counts['removed']}, " if 'removed' in counts else "")
+                   + f"quarantined: {counts['quarantined']}")
         print(message)
         logging.info(message)
+        return counts
     except Exception as e:
         conn.rollback()
-        message = f"Error inserting transactions for {bank_name} from {file_name}: {e}"
+        counterparties.rollback()
+        message = f"Error importing {kind} for {bank_name} from {file_name}: {e}"
         print(message)
         logging.error(message)
+        raise
     finally:
+        statements.close()
         cursor.close()
         conn.close()
 
+def insert_transactions(data, bank_name, file_name, content_hash=None):
+    return import_transaction_file(data, bank_name, file_name, content_hash, 'transactions')
+
+def insert_transactions_sync(data, bank_name, file_name, content_hash=None):
+    def finish(cursor, statements, tracker_id, version_time):
+        removed = list(data['removed'])
+        remove_transactions(statements, removed, tracker_id, version_time)
+        # The cursor only advances together with the last chunk of the deltas it covers
+        update_transactions_cursor(cursor, data, bank_name)
+        return {'removed': len(removed)}
+
+    return import_transaction_file(chain(data['added'], data['modified']), bank_name, file_name, content_hash,
+                                   'transactions sync', finish)
+
 if __name__ == "__main__":
+    setup_logging('insert_transactions', logging.DEBUG)
     fetched_files_dir = 'data/fetched-files'
-    for file_name in os.listdir(fetched_files_dir):
-        if file_name.startswith('plaid_transactions_') and file_name.endswith('.json'):
+    # Sync files must be applied in timestamp order: a file that fails to import raises and stops
+    # the run, so the files after it are not applied over the gap
+    for file_name in sorted(os.listdir(fetched_files_dir)):
+        if not file_name.startswith('plaid_transactions_') or not file_name.endswith(('.json', '.ndjson')):
+            continue
+        file_path = os.path.join(fetched_files_dir, file_name)
+        content_hash = check_file(file_path, file_name)
+        if not content_hash:
+            continue
+
+        if file_name.startswith('plaid_transactions_sync_') and file_name.endswith('.json'):
+            bank_name = file_name.split('_')[3]  # plaid_transactions_sync_<bank>_<timestamp>.json
+            try:
+                sync_data = read_sync_file(file_path)
+            except JSONError as e:
+                logging.error(f"Error decoding JSON from file {file_name}: {e}")
+                print(f"Error decoding JSON from file {file_name}: {e}")
+                continue
+            insert_transactions_sync(sync_data, bank_name, file_name, content_hash)
+        elif file_name.endswith('.ndjson'):
+            bank_name = file_name.split('_')[2]  # Assuming the file name format is consistent
+            # Records are read line by line as they are inserted
+            insert_transactions(read_ndjson(file_path), bank_name, file_name, content_hash)
+        else:
             bank_name = file_name.split('_')[2]  # Assuming the file name format is consistent
-            with open(os.path.join(fetched_files_dir, file_name), 'r') as file:
-                try:
-                    transactions_data = json.load(file)
-                except json.JSONDecodeError as e:
-                    logging.error(f"Error decoding JSON from file {file_name}: {e}")
-                    print(f"Error decoding JSON from file {file_name}: {e}")
-                    continue
-            insert_transactions(transactions_data, bank_name, file_name)
+            # Records are parsed incrementally as they are inserted
+            insert_transactions(iter_json_items(file_path), bank_name, file_name, content_hash)
@@ -1,95 +1,97 @@
 import os
 import logging
-import json
-from dotenv import load_dotenv
-from datetime import datetime
-from urllib.parse import urlparse
-import mysql.connector
 import fetchers.plaid_transactions as fetch_transactions
 import fetchers.plaid_liabilities as fetch_liabilities
 import importers.insert_transactions as insert_transactions
 import importers.insert_liabilities as insert_liabilities
 from utils.plaid_accounts import fetch_account_info, store_accounts_in_db, get_access_tokens_from_db
+from utils.orchestrator import run_items, summarize_results
+from utils.ndjson import read_ndjson
+from utils.json_stream import iter_json_items
+from utils.settings import get_settings, setup_logging
+from utils.db import log_pool_metrics
+from utils.import_ledger import check_file
 
-# Load environment variables from .env file
-load_dotenv()
+def update_accounts(token):
+    access_token = token['access_token']
+    bank_name = token['bank_name']
+    if not access_token:
+        raise RuntimeError(f"Access token for {bank_name} is missing.")
 
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
+    accounts = fetch_account_info(access_token)
+    if not accounts:
+        raise RuntimeError(f"No account information returned for {bank_name}.")
+    store_accounts_in_db(accounts, bank_name)
+    return f"{len(accounts)} accounts"
 
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'main_{today}.log'),
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
+def update_transactions(token):
+    access_token = token['access_token']
+    bank_name = token['bank_name']
+    if not access_token:
+        raise RuntimeError(f"Access token for {bank_name} is missing.")
 
-dbconfig = {
-    "host": urlparse(os.getenv("MYSQL_URL")).hostname,
-    "port": urlparse(os.getenv("MYSQL_URL")).port if urlparse(os.getenv("MYSQL_URL")).port else 3306,
-    "user": os.getenv("MYSQL_USER"),
-    "password": os.getenv("MYSQL_PASSWORD"),
-    "database": urlparse(os.getenv("MYSQL_URL")).path.lstrip('/')
-}
+    mode = get_settings().plaid_transactions_mode
+    if mode == 'sync':
+        transactions_file = fetch_transactions.fetch_transactions_sync(access_token, bank_name, token.get('transactions_cursor'),
+                                                                     token_id=token.get('token_id'))
+    elif mode == 'backfill':
+        transactions_file = fetch_transactions.fetch_transactions_backfill(access_token, bank_name)
+    else:
+        transactions_file = fetch_transactions.fetch_transactions(access_token, bank_name)
+    if not transactions_file:
+        raise RuntimeError(f"Transactions fetch failed for {bank_name}.")
 
-def get_db_connection():
-    return mysql.connector.connect(**dbconfig)
+    # A fetch that returned exactly the content of an imported file is not imported again
+    file_name = os.path.basename(transactions_file)
+    content_hash = check_file(transactions_file, file_name)
+    if not content_hash:
+        return transactions_file
 
-if __name__ == "__main__":
-    print("Starting account update process...")
-    logging.info("Starting account update process...")
+    # Fetched files are parsed incrementally while they are imported
+    if mode == 'sync':
+        sync_data = insert_transactions.read_sync_file(transactions_file)
+        insert_transactions.insert_transactions_sync(sync_data, bank_name, file_name, content_hash)
+    elif transactions_file.endswith('.ndjson'):
+        insert_transactions.insert_transactions(read_ndjson(transactions_file), bank_name, file_name, content_hash)
+    else:
+        insert_transactions.insert_transactions(iter_json_items(transactions_file), bank_name, file_name, content_hash)
+    return transactions_file
 
-    # Update account information first
-    tokens = get_access_tokens_from_db()
-    for token in tokens:
-        access_token = token['access_token']
-        bank_name = token['bank_name']
-        bank_id = token['bank_id']
-        
-        if access_token:
-            accounts = fetch_account_info(access_token)
-            if accounts:
-                store_accounts_in_db(accounts, bank_name)
-        else:
-            message = f"Access token for {bank_name} is missing."
-            print(message)
-            logging.error(message)
-    
-    print("Account update process completed.")
-    logging.info("Account update process completed.")
-    
+def update_liabilities(token):
+    access_token = token['access_token']
+    bank_name = token['bank_name']
+    if not access_token:
+        raise RuntimeError(f"Access token for {bank_name} is missing.")
+
+    liabilities_file = fetch_liabilities.fetch_liabilities(access_token, bank_name)
+    if not liabilities_file:
+        raise RuntimeError(f"Liabilities fetch failed for {bank_name}.")
+
+    file_name = os.path.basename(liabilities_file)
+    content_hash = check_file(liabilities_file, file_name)
+    if content_hash:
+        liabilities_data = insert_liabilities.read_liabilities_file(liabilities_file)
+        insert_liabilities.insert_liabilities(liabilities_data, bank_name, file_name, content_hash)
+    return liabilities_file
+
+PRODUCTS = {
+    'accounts': update_accounts,
+    'transactions': update_transactions,
+    'liabilities': update_liabilities,
+}
+
+if __name__ == "__main__":
+    setup_logging('main')
     print("Starting fetch and import process...")
     logging.info("Starting fetch and import process...")
-    
-    tokens = get_access_tokens_from_db()
-    for token in tokens:
-        access_token = token['access_token']
-        bank_name = token['bank_name']
-        bank_name = token['bank_name']
 
-        # Fetch transactions
-        transactions_file = fetch_transactions.fetch_transactions(access_token, bank_name)
-        if transactions_file:
-            try:
-                with open(transactions_file, 'r') as file:
-                    transactions_data = json.load(file)
-                insert_transactions.insert_transactions(transactions_data, bank_name, os.path.basename(transactions_file))
-            except Exception as e:
-                logging.error(f"Error inserting transactions for {bank_name} from {transactions_file}: {e}")
-                print(f"Error inserting transactions for {bank_name} from {transactions_file}: {e}")
-
-        # Fetch liabilities
-        liabilities_file = fetch_liabilities.fetch_liabilities(access_token, bank_name)
-        if liabilities_file:
-            try:
-                with open(liabilities_file, 'r') as file:
-                    liabilities_data = json.load(file)
-                insert_liabilities.insert_liabilities(liabilities_data, bank_name, os.path.basename(liabilities_file))
-            except Exception as e:
-                logging.error(f"Error inserting liabilities for {bank_name} from {liabilities_file}: {e}")
-                print(f"Error inserting liabilities for {bank_name} from {liabilities_file}: {e}")
+    tokens = get_access_tokens_from_db()
+    results = run_items(tokens, PRODUCTS)
+    summary, report = summarize_results(results)
 
+    print(report)
+    logging.info(f"Fetch and import summary:\n{report}")
+    insert_transactions.compact_pending_transactions()
+    log_pool_metrics()
     print("Fetch and import process completed.")
     logging.info("Fetch and import process completed.")
@@ -1,8 +1,6 @@
 import os
+import sys
 from flask import Flask, request, jsonify, send_from_directory
-from dotenv import load_dotenv
-from plaid.api import plaid_api
-from plaid import configuration, api_client
 from plaid.api_client import ApiException
 from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
 from plaid.model.link_token_create_request import LinkTokenCreateRequest
@@ -11,8 +9,14 @@ from plaid.model.country_code import CountryCode
 from plaid.model.products import Products
 import logging
 
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.plaid_client import get_plaid_client
+from utils.settings import get_settings
+
 app = Flask(__name__)
-load_dotenv()
 
 def setup_logging():
     log_dir = 'logs'
@@ -33,27 +37,6 @@ def setup_logging():
 
 setup_logging()
 
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-PLAID_ENV = os.getenv("PLAID_ENV", "development")
-
-PLAID_ENV_URLS = {
-    "sandbox": "https://sandbox.plaid.com",
-    "development": "https://development.plaid.com",
-    "production": "https://production.plaid.com"
-}
-PLAID_HOST = PLAID_ENV_URLS.get(PLAID_ENV, "https://production.plaid.com")
-
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
-
 @app.route('/exchange_public_token', methods=['POST'])
 def exchange_public_token_endpoint():
     try:
@@ -66,11 +49,11 @@ def exchange_public_token_endpoint():
             return jsonify({'error': 'public_token is required'}), 400
 
         exchange_request = ItemPublicTokenExchangeRequest(
-            client_id=PLAID_CLIENT_ID,
-            secret=PLAID_SECRET,
+            client_id=get_settings().plaid_client_id,
+            secret=get_settings().plaid_secret,
             public_token=public_token
         )
-        response = client.item_public_token_exchange(exchange_request)
+        response = get_plaid_client().item_public_token_exchange(exchange_request)
         access_token = response['access_token']
         logging.debug(f'exchange_public_token: Exchange successful. Access token: {access_token}')
         return jsonify({'access_token': access_token})
@@ -100,7 +83,7 @@ def create_update_token():
             language='en',
             access_token=access_token
         )
-        response = client.link_token_create(update_request_data)
+        response = get_plaid_client().link_token_create(update_request_data)
         update_token = response['link_token']
         logging.debug(f'create_update_token: Generated update token: {update_token}')
         return jsonify({'update_token': update_token})
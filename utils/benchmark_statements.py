@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import logging
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from importers.insert_transactions import TRANSACTION_COLUMNS, column_list, transaction_row
+from utils.db import get_db_connection, StatementCache
+from utils.settings import setup_logging
+
+# Micro-benchmark of plain text statements against server-side prepared statements for the
+# importers' row-at-a-time SQL: the 46-column plaid_transactions insert and the history
+# INSERT ... SELECT. Both run once per row against temporary copies of the tables, so
+# nothing is written to the real tables. Compare the two runs' time and Com_stmt_* counters.
+
+BENCHMARK_ROWS = 50000
+COMMIT_EVERY = 5000
+
+def sample_transaction(i):
+    return {
+        'account_id': f'benchmark-account-{i % 10}',
+        'transaction_id': f'benchmark-transaction-{i}',
+        'amount': round(i * 0.37, 2),
+        'date': '2024-06-26',
+        'iso_currency_code': 'CAD',
+        'name': f'Benchmark merchant {i % 500}',
+        'merchant_name': f'Benchmark merchant {i % 500}',
+        'payment_channel': 'in store',
+        'pending': False,
+        'transaction_type': 'place',
+        'category': ['Shops', 'Benchmark'],
+        'category_id': '19000000',
+        'location': {'city': 'Toronto', 'region': 'ON', 'country': 'CA'},
+        'personal_finance_category': {'primary': 'GENERAL_MERCHANDISE', 'detailed': 'GENERAL_MERCHANDISE_OTHER',
+                                      'confidence_level': 'HIGH'},
+    }
+
+def session_counters(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SHOW SESSION STATUS WHERE Variable_name IN ('Com_stmt_prepare', 'Com_stmt_execute', 'Questions')")
+        return {name: int(value) for name, value in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+def run_pass(conn, prepared, rows):
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM benchmark_transactions_history")
+    cursor.execute("DELETE FROM benchmark_transactions")
+    conn.commit()
+    cursor.close()
+
+    insert_sql = (f"INSERT INTO benchmark_transactions ({column_list(TRANSACTION_COLUMNS)}) "
+                  f"VALUES ({', '.join(['%s'] * len(TRANSACTION_COLUMNS))})")
+    archive_sql = (f"INSERT INTO benchmark_transactions_history ({column_list(TRANSACTION_COLUMNS)}) "
+                   f"SELECT {column_list(TRANSACTION_COLUMNS[:-1])}, %s "
+                   f"FROM benchmark_transactions WHERE transaction_id = %s")
+
+    statements = StatementCache(conn, prepared=prepared)
+    before = session_counters(conn)
+    start = time.perf_counter()
+    try:
+        for i in range(rows):
+            statements.execute(insert_sql, transaction_row(sample_transaction(i), 0))
+            statements.execute(archive_sql, (0, f'benchmark-transaction-{i}'))
+            if (i + 1) % COMMIT_EVERY == 0:
+                conn.commit()
+        conn.commit()
+    finally:
+        statements.close()
+    seconds = time.perf_counter() - start
+    after = session_counters(conn)
+
+    return {
+        'mode': 'prepared' if prepared else 'text',
+        'seconds': round(seconds, 2),
+        'rows_per_second': round(rows / seconds),
+        **{name: after[name] - before[name] for name in before},
+    }
+
+def run_benchmark(rows=BENCHMARK_ROWS):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS benchmark_transactions, benchmark_transactions_history")
+        cursor.execute("CREATE TEMPORARY TABLE benchmark_transactions LIKE plaid_transactions")
+        # The history table is partitioned and a temporary table cannot be, so only its columns are copied
+        cursor.execute("CREATE TEMPORARY TABLE benchmark_transactions_history AS SELECT * FROM plaid_transactions_history LIMIT 0")
+        cursor.execute("ALTER TABLE benchmark_transactions_history MODIFY id INT AUTO_INCREMENT, ADD PRIMARY KEY (id)")
+        # Warm up the buffer pool and the temporary tables so neither pass pays for it
+        run_pass(conn, prepared=False, rows=min(rows, COMMIT_EVERY))
+        results = [run_pass(conn, prepared=False, rows=rows), run_pass(conn, prepared=True, rows=rows)]
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS benchmark_transactions, benchmark_transactions_history")
+    finally:
+        cursor.close()
+        conn.close()
+    return results
+
+if __name__ == "__main__":
+    setup_logging('benchmark_statements')
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else BENCHMARK_ROWS
+    results = run_benchmark(rows)
+    for result in results:
+        message = ("{mode}: {seconds}s for {rows} rows ({rows_per_second} rows/s), "
+                   "{Com_stmt_prepare} prepares, {Com_stmt_execute} executes, {Questions} statements").format(rows=rows, **result)
+        print(message)
+        logging.info(message)
+    text, prepared = results
+    message = f"Prepared statements: {round((1 - prepared['seconds'] / text['seconds']) * 100, 1)}% less time than text statements"
+    print(message)
+    logging.info(message)
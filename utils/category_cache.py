@@ -0,0 +1,52 @@
+import logging
+import threading
+from utils.db import get_db_connection
+
+# In-memory map from Plaid's category_id to the integer category_key of the categories table
+# (migration 005), loaded once per run so the importer resolves each transaction's category
+# without a database round trip. A category missing from the table (categories not fetched yet,
+# or new at Plaid) resolves to NULL; utils/plaid_categories.py links those transactions once
+# the categories are stored.
+
+class CategoryCache:
+    def __init__(self):
+        self.keys = {}
+        self.missing = set()
+        self.lock = threading.Lock()
+
+    def load(self):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT category_id, category_key FROM categories")
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+        with self.lock:
+            self.keys = dict(rows)
+            self.missing = set()
+        logging.info(f"Loaded category cache: {len(self.keys)} categories")
+
+    def category_key(self, category_id):
+        key = self.keys.get(category_id)
+        if key is None and category_id:
+            with self.lock:
+                if category_id in self.missing:
+                    return None
+                self.missing.add(category_id)
+            logging.warning(f"Category {category_id} is not in the categories table, run utils/plaid_categories.py")
+        return key
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_category_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache = CategoryCache()
+                cache.load()
+                _cache = cache
+    return _cache
@@ -0,0 +1,133 @@
+import os
+import sys
+import logging
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from importers.insert_transactions import SUPERSEDED_BY_POSTED, STALE_PENDING
+from utils.db import get_db_connection
+from utils.settings import setup_logging
+
+# Plan regression check for the importer and reporting queries the indexes are built for.
+# Each query names the index it relies on for every table it reads. The check fails when that
+# index is not among the keys the optimizer could use (it is missing, or no longer matches the
+# query), when a table is fully scanned (type ALL) or its index fully scanned (type index), or
+# when the chosen index still needs a filesort. On a small or empty database the optimizer scans
+# tables of fewer than SMALL_TABLE_ROWS rows although the index is usable; only that is a warning.
+# Run it after `python utils/migrate.py`; the exit status is 1 when a plan fails.
+
+SMALL_TABLE_ROWS = 1000
+
+# (name, query, parameters, {table or alias: acceptable indexes})
+QUERY_PLANS = [
+    ('account statement', """
+        SELECT transaction_id, date, name, amount FROM plaid_transactions
+        WHERE account_id = %s AND date BETWEEN %s AND %s ORDER BY date
+    """, ('account', '2024-01-01', '2024-12-31'), {'plaid_transactions': ('account_date',)}),
+    ('account spend', """
+        SELECT SUM(amount) FROM plaid_transactions
+        WHERE account_id = %s AND date BETWEEN %s AND %s
+    """, ('account', '2024-01-01', '2024-12-31'), {'plaid_transactions': ('account_date',)}),
+    ('category spend', """
+        SELECT date, SUM(amount) FROM plaid_transactions
+        WHERE personal_finance_category_primary = %s AND date BETWEEN %s AND %s
+        GROUP BY date ORDER BY date
+    """, ('FOOD_AND_DRINK', '2024-01-01', '2024-12-31'), {'plaid_transactions': ('category_date',)}),
+    ('category rollup', """
+        SELECT c.hierarchy_level2, SUM(t.amount) FROM categories c
+        JOIN plaid_transactions t ON t.category_key = c.category_key AND t.date BETWEEN %s AND %s
+        WHERE c.hierarchy_level1 = %s
+        GROUP BY c.hierarchy_level2
+    """, ('2024-01-01', '2024-12-31', 'Food and Drink'), {'c': ('hierarchy',), 't': ('category_key_date',)}),
+    ('account history', """
+        SELECT transaction_id, date, amount, file_import_id FROM plaid_transactions_history
+        WHERE account_id = %s AND date BETWEEN %s AND %s ORDER BY date
+    """, ('account', '2024-01-01', '2024-12-31'), {'plaid_transactions_history': ('account_date',)}),
+    ('transaction history', """
+        SELECT * FROM plaid_transactions_history WHERE transaction_id = %s ORDER BY id
+    """, ('transaction',), {'plaid_transactions_history': ('transaction_id', 'transaction_validity')}),
+    ('account as of', """
+        SELECT transaction_id, amount, valid_from, valid_to FROM plaid_transaction_versions
+        WHERE account_id = %s AND valid_from <= %s AND valid_to > %s
+    """, ('account', '2024-06-30 00:00:00', '2024-06-30 00:00:00'), {'plaid_transactions': ('account_valid_from',), 'plaid_transactions_history': ('account_validity',)}),
+    ('transaction as of', """
+        SELECT * FROM plaid_transactions_history
+        WHERE transaction_id = %s AND valid_to > %s AND valid_from <= %s
+    """, ('transaction', '2024-06-30 00:00:00', '2024-06-30 00:00:00'), {'plaid_transactions_history': ('transaction_validity',)}),
+    ('merchant spend', """
+        SELECT SUM(t.amount) FROM plaid_transaction_counterparties c
+        JOIN plaid_transactions t ON t.transaction_id = c.transaction_id
+        WHERE c.counterparty_key = %s AND t.date BETWEEN %s AND %s
+    """, ('0' * 32, '2024-01-01', '2024-12-31'), {'c': ('counterparty_transactions',), 't': ('transaction_id', 'transaction_id_2')}),
+    ('merchant by entity', """
+        SELECT counterparty_key, name FROM counterparties WHERE entity_id = %s
+    """, ('entity',), {'counterparties': ('entity_id',)}),
+    ('import ledger', """
+        SELECT file_name, content_hash FROM file_import_tracker WHERE status = 'complete'
+    """, (), {'file_import_tracker': ('status_file',)}),
+    ('import resume', """
+        SELECT id, status, records_committed FROM file_import_tracker
+        WHERE file_name = %s ORDER BY id DESC LIMIT 1
+    """, ('plaid_transactions_bank_20240101000000.json',), {'file_import_tracker': ('file_name',)}),
+    ('superseded pending', f"""
+        SELECT t.transaction_id FROM plaid_transactions t {SUPERSEDED_BY_POSTED}
+    """, (), {'t': ('pending', 'transaction_id', 'transaction_id_2'), 'posted': ('pending_transaction_id', 'pending')}),
+    ('stale pending', f"""
+        SELECT t.transaction_id FROM plaid_transactions t {STALE_PENDING}
+    """, ('2024-01-01',), {'t': ('pending',)}),
+]
+
+def check_plan(rows, indexes):
+    # Returns (failures, warnings) for the rows of one EXPLAIN
+    failures, warnings = [], []
+    for row in rows:
+        table, access, extra = row['table'], row['type'], row['Extra'] or ''
+        if not table or table.startswith('<'):
+            continue  # No table read, or the temporary result of a view, derived table or UNION
+        expected = indexes.get(table, ())
+        usable = set(expected) & set((row['possible_keys'] or '').split(','))
+        if not usable:
+            failures.append(f"{table} cannot use {' or '.join(expected) or 'any expected index'} "
+                            f"(possible keys: {row['possible_keys']})")
+        if access in ('ALL', 'index'):
+            scan = 'full scan' if access == 'ALL' else 'full index scan'
+            if usable and (row['rows'] or 0) < SMALL_TABLE_ROWS:
+                warnings.append(f"{scan} of {table} chosen over {', '.join(sorted(usable))}: only {row['rows']} rows")
+            else:
+                failures.append(f"{scan} of {table} ({row['rows']} rows)")
+        if 'Using filesort' in extra and row['key']:
+            failures.append(f"filesort on {table} although index {row['key']} is used")
+    return failures, warnings
+
+def check_query_plans(queries=QUERY_PLANS):
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    failed = []
+    try:
+        for name, query, params, indexes in queries:
+            cursor.execute(f"EXPLAIN {query}", params)
+            failures, warnings = check_plan(cursor.fetchall(), indexes)
+            for warning in warnings:
+                logging.warning(f"{name}: {warning}")
+                print(f"WARN {name}: {warning}")
+            if failures:
+                failed.append(name)
+                for failure in failures:
+                    logging.error(f"{name}: {failure}")
+                    print(f"FAIL {name}: {failure}")
+            else:
+                print(f"ok   {name}")
+    finally:
+        cursor.close()
+        conn.close()
+    return failed
+
+if __name__ == "__main__":
+    setup_logging('check_query_plans')
+    failed = check_query_plans()
+    message = f"{len(failed)} of {len(QUERY_PLANS)} query plans failed" if failed else f"All {len(QUERY_PLANS)} query plans passed"
+    print(message)
+    logging.info(message)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,169 @@
+import os
+import sys
+import logging
+from datetime import date, datetime
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from importers.insert_transactions import TRANSACTION_COLUMNS, COUNTERPARTY_COLUMNS, column_list
+from utils.db import get_db_connection
+from utils.settings import get_settings, setup_logging
+
+# Maintenance job for the partitioned history tables (migration 002). Run it periodically, e.g. monthly:
+#  1. splits the catch-all pmax partition into monthly partitions up to PARTITIONS_AHEAD months ahead,
+#  2. collapses runs of identical consecutive versions of a transaction into their first version,
+#  3. drops the monthly partitions older than HISTORY_RETENTION_MONTHS (0 keeps everything).
+
+HISTORY_TABLES = ['plaid_transactions_history', 'plaid_transaction_counterparties_history']
+PARTITIONS_AHEAD = 3
+
+def add_months(month, months):
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return date(month.year + years, month_index + 1, 1)
+
+def partition_month(name):
+    # Monthly partitions are named p<YYYYMM>
+    return date(int(name[1:5]), int(name[5:7]), 1)
+
+def list_partitions(cursor, table):
+    cursor.execute("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    return [name for (name,) in cursor.fetchall()]
+
+def add_month_partitions(cursor, table, until):
+    # On the first run pmax still holds every existing row, so the monthly partitions start at the
+    # oldest month present and the rows are moved once. Afterwards pmax is empty and the split is instant.
+    partitions = list_partitions(cursor, table)
+    if 'pmax' not in partitions:
+        logging.warning(f"{table} is not partitioned, run utils/migrate.py first")
+        return 0
+    monthly = [name for name in partitions if name != 'pmax']
+    if monthly:
+        month = add_months(partition_month(monthly[-1]), 1)
+    else:
+        cursor.execute(f"SELECT MIN(created_at) FROM {table}")
+        oldest = cursor.fetchone()[0] or datetime.now()
+        month = oldest.date().replace(day=1)
+
+    definitions = []
+    while month <= until:
+        definitions.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN (UNIX_TIMESTAMP('{add_months(month, 1):%Y-%m-%d}'))")
+        month = add_months(month, 1)
+    if definitions:
+        cursor.execute(f"""
+            ALTER TABLE {table} REORGANIZE PARTITION pmax INTO (
+                {', '.join(definitions)}, PARTITION pmax VALUES LESS THAN MAXVALUE
+            )
+        """)
+    return len(definitions)
+
+def drop_expired_partitions(cursor, table, retention_months):
+    # Only partitions whose whole month is before the horizon are dropped
+    horizon = add_months(date.today().replace(day=1), -retention_months)
+    expired = [name for name in list_partitions(cursor, table)
+               if name != 'pmax' and add_months(partition_month(name), 1) <= horizon]
+    if expired:
+        cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}")
+    return expired
+
+def collapse_identical_versions(conn, cursor):
+    # A version is a history row plus the counterparty rows archived with it (same transaction_id
+    # and file_import_id). A run of consecutive identical versions of a transaction is collapsed into
+    # its first version, which takes the run's last valid_to so the validity range has no gap.
+    # Versions without a file import, or archived twice by one file, cannot be matched to their
+    # counterparties unambiguously; they always start a new run and are kept.
+    transaction_fields = column_list(TRANSACTION_COLUMNS[:-2], 'h.')  # Without row_hash and file_import_id
+    counterparty_fields = column_list(COUNTERPARTY_COLUMNS[:-2])
+    cursor.execute("SET SESSION group_concat_max_len = 1048576")
+    cursor.execute("DROP TEMPORARY TABLE IF EXISTS history_runs, collapsed_runs, duplicate_versions")
+    cursor.execute(f"""
+        CREATE TEMPORARY TABLE history_runs AS
+        SELECT id, created_at, transaction_id, file_import_id, valid_to,
+            SUM(new_run) OVER (PARTITION BY transaction_id ORDER BY id) AS run
+        FROM (
+            SELECT id, created_at, transaction_id, file_import_id, valid_to,
+                CASE WHEN fingerprint = LAG(fingerprint) OVER (PARTITION BY transaction_id ORDER BY id)
+                          AND file_import_id IS NOT NULL AND versions_in_file = 1
+                     THEN 0 ELSE 1 END AS new_run
+            FROM (
+                SELECT h.id, h.created_at, h.transaction_id, h.file_import_id, h.valid_to,
+                    MD5(CONCAT(JSON_ARRAY({transaction_fields}), COALESCE(c.fingerprint, ''))) AS fingerprint,
+                    COUNT(*) OVER (PARTITION BY h.transaction_id, h.file_import_id) AS versions_in_file
+                FROM plaid_transactions_history h
+                LEFT JOIN (
+                    SELECT transaction_id, file_import_id,
+                        GROUP_CONCAT(MD5(JSON_ARRAY({counterparty_fields})) ORDER BY MD5(JSON_ARRAY({counterparty_fields}))) AS fingerprint
+                    FROM plaid_transaction_counterparties_history
+                    GROUP BY transaction_id, file_import_id
+                ) c ON c.transaction_id = h.transaction_id AND c.file_import_id = h.file_import_id
+            ) fingerprinted
+        ) versions
+    """)
+    cursor.execute("""
+        CREATE TEMPORARY TABLE collapsed_runs AS
+        SELECT transaction_id, run, MIN(id) AS kept_id, MAX(valid_to) AS valid_to
+        FROM history_runs GROUP BY transaction_id, run HAVING COUNT(*) > 1
+    """)
+    cursor.execute("""
+        CREATE TEMPORARY TABLE duplicate_versions AS
+        SELECT v.id, v.created_at, v.transaction_id, v.file_import_id
+        FROM history_runs v
+        JOIN collapsed_runs r ON r.transaction_id = v.transaction_id AND r.run = v.run
+        WHERE v.id <> r.kept_id
+    """)
+    try:
+        cursor.execute("""
+            UPDATE plaid_transactions_history h
+            JOIN collapsed_runs r ON r.transaction_id = h.transaction_id AND r.kept_id = h.id
+            SET h.valid_to = r.valid_to
+        """)
+        cursor.execute("""
+            DELETE c FROM plaid_transaction_counterparties_history c
+            JOIN duplicate_versions d ON d.transaction_id = c.transaction_id AND d.file_import_id = c.file_import_id
+        """)
+        cursor.execute("""
+            DELETE h FROM plaid_transactions_history h
+            JOIN duplicate_versions d ON d.id = h.id AND d.created_at = h.created_at
+        """)
+        collapsed = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS history_runs, collapsed_runs, duplicate_versions")
+    return collapsed
+
+def compact_history(retention_months=None):
+    retention_months = get_settings().history_retention_months if retention_months is None else retention_months
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        until = add_months(date.today().replace(day=1), PARTITIONS_AHEAD)
+        for table in HISTORY_TABLES:
+            added = add_month_partitions(cursor, table, until)
+            logging.info(f"{table}: added {added} monthly partitions")
+
+        collapsed = collapse_identical_versions(conn, cursor)
+        message = f"Collapsed {collapsed} identical transaction versions"
+        print(message)
+        logging.info(message)
+
+        if retention_months:
+            for table in HISTORY_TABLES:
+                expired = drop_expired_partitions(cursor, table, retention_months)
+                message = f"{table}: dropped {len(expired)} partitions older than {retention_months} months {expired}"
+                print(message)
+                logging.info(message)
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == "__main__":
+    setup_logging('compact_history')
+    compact_history()
@@ -0,0 +1,38 @@
+import threading
+
+# In-process record of the counterparty dimension rows (migration 004) written by this run, so each
+# counterparty's attributes are sent to the database once rather than with every transaction.
+# Keys written in a transaction only become known once it commits: a rolled-back chunk may have
+# taken its dimension rows with it, and they are written again by the next record that needs them.
+
+_written = {}
+_written_lock = threading.Lock()
+
+class CounterpartyCache:
+    # One per file import; the committed keys are shared by every import in the process
+    def __init__(self):
+        self.pending = {}
+        self.hits = 0
+        self.writes = 0
+
+    def needs_write(self, counterparty_key, attributes):
+        # True when the dimension row is unknown or its attributes changed; the caller writes it
+        if counterparty_key in self.pending:
+            known = self.pending[counterparty_key]
+        else:
+            with _written_lock:
+                known = _written.get(counterparty_key)
+        if known == attributes:
+            self.hits += 1
+            return False
+        self.pending[counterparty_key] = attributes
+        self.writes += 1
+        return True
+
+    def commit(self):
+        with _written_lock:
+            _written.update(self.pending)
+        self.pending.clear()
+
+    def rollback(self):
+        self.pending.clear()
@@ -0,0 +1,305 @@
+import os
+import logging
+import tempfile
+import threading
+import time
+import mysql.connector
+from mysql.connector import pooling
+from utils.settings import get_settings
+
+_connection_pool = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+_metrics = {'checkouts': 0, 'waits': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0,
+            'in_use': 0, 'peak_in_use': 0, 'reconnects': 0}
+_metrics_lock = threading.Lock()
+
+def get_connection_pool():
+    # One pool per process, opened the first time a module actually needs the database.
+    # Size it for the workload: FETCH_MAX_WORKERS / IMPORT_MAX_WORKERS plus a spare.
+    global _connection_pool, _pool_slots
+    if _connection_pool is None:
+        with _pool_lock:
+            if _connection_pool is None:
+                settings = get_settings()
+                _pool_slots = threading.BoundedSemaphore(settings.db_pool_size)
+                _connection_pool = pooling.MySQLConnectionPool(
+                    pool_name="mypool",
+                    pool_size=settings.db_pool_size,
+                    **settings.mysql_config
+                )
+    return _connection_pool
+
+def session_settings_sql():
+    settings = get_settings()
+    return f"SET SESSION innodb_lock_wait_timeout = {settings.db_lock_wait_timeout}"
+
+def apply_session_settings(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(session_settings_sql())
+    finally:
+        cursor.close()
+
+def prepare_session(conn):
+    # Session settings are reapplied on every checkout because the pool resets sessions on return.
+    # The statement doubles as the health check: a dropped connection is reconnected and retried once.
+    try:
+        apply_session_settings(conn)
+    except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError) as e:
+        settings = get_settings()
+        logging.warning(f"Pooled MySQL connection is not usable ({e}), reconnecting...")
+        conn.reconnect(attempts=settings.db_reconnect_attempts, delay=settings.db_reconnect_delay)
+        with _metrics_lock:
+            _metrics['reconnects'] += 1
+        apply_session_settings(conn)
+
+class PooledConnection:
+    # Hands the pool slot back when closed; everything else goes to the pooled connection
+    def __init__(self, conn):
+        self._conn = conn
+        self._closed = False
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._conn.close()
+        finally:
+            _pool_slots.release()
+            with _metrics_lock:
+                _metrics['in_use'] -= 1
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+def get_db_connection():
+    # Waits up to DB_POOL_TIMEOUT for a free connection instead of failing as soon as the pool is empty
+    pool = get_connection_pool()
+    settings = get_settings()
+
+    start = time.monotonic()
+    if not _pool_slots.acquire(timeout=settings.db_pool_timeout):
+        raise pooling.PoolError(f"No MySQL connection available after {settings.db_pool_timeout} seconds "
+                                f"(DB_POOL_SIZE={settings.db_pool_size})")
+    waited = time.monotonic() - start
+
+    with _metrics_lock:
+        _metrics['checkouts'] += 1
+        if waited > 0.001:
+            _metrics['waits'] += 1
+        _metrics['wait_seconds'] += waited
+        _metrics['max_wait_seconds'] = max(_metrics['max_wait_seconds'], waited)
+        _metrics['in_use'] += 1
+        _metrics['peak_in_use'] = max(_metrics['peak_in_use'], _metrics['in_use'])
+
+    conn = None
+    try:
+        conn = PooledConnection(pool.get_connection())
+        prepare_session(conn)
+        return conn
+    except Exception:
+        if conn is not None:
+            conn.close()
+        else:
+            _pool_slots.release()
+            with _metrics_lock:
+                _metrics['in_use'] -= 1
+        raise
+
+def get_pool_metrics():
+    # Saturation metrics for tuning DB_POOL_SIZE: many waits or a high max wait mean the pool is too small
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    metrics['pool_size'] = get_settings().db_pool_size
+    metrics['wait_seconds'] = round(metrics['wait_seconds'], 3)
+    metrics['max_wait_seconds'] = round(metrics['max_wait_seconds'], 3)
+    return metrics
+
+def log_pool_metrics():
+    metrics = get_pool_metrics()
+    message = ("MySQL pool: {checkouts} checkouts, {waits} waited ({wait_seconds}s total, {max_wait_seconds}s max), "
+               "peak {peak_in_use}/{pool_size} in use, {reconnects} reconnects").format(**metrics)
+    print(message)
+    logging.info(message)
+
+LOCK_WAIT_TIMEOUT_ERRNO = 1205
+# A deadlock rolls back the whole transaction, so it cannot be retried per statement;
+# import_in_chunks retries the chunk instead
+DEADLOCK_ERRNO = 1213
+
+def execute_with_retry(execute, *args, max_retries=None, delay=None):
+    # A lock wait timeout only rolls back the statement that timed out, so it is safe to retry it
+    settings = get_settings()
+    max_retries = settings.db_lock_retries if max_retries is None else max_retries
+    delay = settings.db_lock_retry_delay if delay is None else delay
+
+    for attempt in range(max_retries):
+        try:
+            return execute(*args)
+        except mysql.connector.Error as e:
+            if e.errno != LOCK_WAIT_TIMEOUT_ERRNO or attempt >= max_retries - 1:
+                raise
+            logging.warning(f"Lock wait timeout exceeded, retrying in {delay} seconds... (attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+
+class RetryingCursor:
+    # Cursor wrapper giving every execute/executemany the same lock-wait retry policy
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None):
+        return execute_with_retry(self._cursor.execute, operation, params)
+
+    def executemany(self, operation, seq_params):
+        return execute_with_retry(self._cursor.executemany, operation, seq_params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+def retrying_cursor(conn, **kwargs):
+    return RetryingCursor(conn.cursor(**kwargs))
+
+class StatementCache:
+    # Server-side prepared statements for SQL an importer runs many times on one connection.
+    # Each distinct statement is parsed by the server once and then only executed with new
+    # parameters. A prepared cursor holds a single statement, so there is one per SQL text.
+    # Prepared statements belong to the session and the pool resets the session when the
+    # connection is returned, so a cache lives as long as one connection checkout.
+    # With IMPORT_PREPARED_STATEMENTS=false statements are sent as plain text instead.
+    def __init__(self, conn, prepared=None):
+        self._conn = conn
+        self._prepared = get_settings().import_prepared_statements if prepared is None else prepared
+        self._cursors = {}
+        self.prepares = 0
+        self.executions = 0
+
+    def cursor(self, sql):
+        cursor = self._cursors.get(sql)
+        if cursor is None:
+            cursor = retrying_cursor(self._conn, prepared=True) if self._prepared else retrying_cursor(self._conn)
+            self._cursors[sql] = cursor
+            self.prepares += 1
+        return cursor
+
+    def execute(self, sql, params=()):
+        # Returns the cursor, for statements whose result is read
+        cursor = self.cursor(sql)
+        cursor.execute(sql, params)
+        self.executions += 1
+        return cursor
+
+    def close(self):
+        for cursor in self._cursors.values():
+            cursor.close()
+        self._cursors = {}
+
+def database_time(statements):
+    # The server's clock, so version timestamps agree with the DEFAULT CURRENT_TIMESTAMP columns
+    return statements.execute("SELECT NOW()").fetchall()[0][0]
+
+# Errors meaning the server or client refuses LOAD DATA LOCAL INFILE:
+# 1148 ER_NOT_ALLOWED_COMMAND, 3948 ER_CLIENT_LOCAL_FILES_DISABLED, 2068 CR_LOAD_DATA_LOCAL_INFILE_REJECTED
+LOCAL_INFILE_DISABLED_ERRNOS = {1148, 3948, 2068}
+
+# Set by the first import that finds local infile refused; the importers run on a thread pool
+_local_infile_disabled = False
+_local_infile_lock = threading.Lock()
+
+def local_infile_allowed():
+    with _local_infile_lock:
+        return not _local_infile_disabled
+
+def disable_local_infile():
+    # True for the first caller only, so the fallback is reported once per run
+    global _local_infile_disabled
+    with _local_infile_lock:
+        if _local_infile_disabled:
+            return False
+        _local_infile_disabled = True
+        return True
+
+def column_names(columns):
+    return ", ".join(f"`{column}`" for column in columns)
+
+def tsv_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+def load_data_local_infile(cursor, table, columns, rows):
+    # Rows are written to a temporary TSV file and streamed to the server in one statement
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', suffix='.tsv', delete=False) as file:
+        for row in rows:
+            file.write('\t'.join(tsv_value(value) for value in row) + '\n')
+        tsv_path = file.name
+
+    try:
+        cursor.execute(f"""
+            LOAD DATA LOCAL INFILE %s INTO TABLE {table}
+            CHARACTER SET utf8mb4
+            FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+            LINES TERMINATED BY '\\n'
+            ({column_names(columns)})
+        """, (tsv_path,))
+    finally:
+        os.remove(tsv_path)
+
+def insert_many(cursor, table, columns, rows, batch_size):
+    # executemany sends each batch as a single multi-row INSERT
+    sql = f"INSERT INTO {table} ({column_names(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    for i in range(0, len(rows), batch_size):
+        cursor.executemany(sql, rows[i:i+batch_size])
+
+def upsert_many(cursor, table, columns, rows, key_columns, batch_size=None):
+    # Multi-row INSERT ... ON DUPLICATE KEY UPDATE: new keys are inserted, existing ones take the new values
+    if not rows:
+        return
+    updates = ", ".join(f"`{column}` = VALUES(`{column}`)" for column in columns if column not in key_columns)
+    sql = (f"INSERT INTO {table} ({column_names(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+           f"ON DUPLICATE KEY UPDATE {updates}")
+    batch_size = batch_size or get_settings().import_batch_size
+    for i in range(0, len(rows), batch_size):
+        cursor.executemany(sql, rows[i:i+batch_size])
+
+def staging_batch_size():
+    # Rows buffered before each bulk_insert into a staging table
+    settings = get_settings()
+    return settings.bulk_load_batch_size if settings.import_bulk_load else settings.import_batch_size
+
+def bulk_insert(cursor, table, columns, rows, batch_size=None):
+    # LOAD DATA LOCAL INFILE when IMPORT_BULK_LOAD is on, batched INSERTs otherwise
+    # or when the server refuses local infile. rows must be a list.
+    if not rows:
+        return
+    settings = get_settings()
+
+    if settings.import_bulk_load and local_infile_allowed():
+        try:
+            # LOAD DATA LOCAL always runs as IGNORE: bad values are clamped or truncated with only a
+            # warning. A batch that warns is undone and inserted again below, where strict mode
+            # raises on the bad rows so they reach the quarantine.
+            cursor.execute("SAVEPOINT bulk_load")
+            load_data_local_infile(cursor, table, columns, rows)
+            if not cursor.warning_count:
+                cursor.execute("RELEASE SAVEPOINT bulk_load")
+                return
+            cursor.execute("SHOW WARNINGS LIMIT 1")
+            warning = cursor.fetchall()
+            cursor.execute("ROLLBACK TO SAVEPOINT bulk_load")
+            logging.warning(f"LOAD DATA into {table} gave warnings ({warning[0][2] if warning else 'unknown'}), "
+                            f"inserting the batch with INSERTs instead")
+        except mysql.connector.Error as e:
+            if e.errno not in LOCAL_INFILE_DISABLED_ERRNOS:
+                raise
+            if disable_local_infile():
+                message = f"LOAD DATA LOCAL INFILE is not allowed ({e}), falling back to batched inserts."
+                print(message)
+                logging.warning(message)
+
+    insert_many(cursor, table, columns, rows, batch_size or settings.import_batch_size)
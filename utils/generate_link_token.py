@@ -1,7 +1,5 @@
 import os
-from dotenv import load_dotenv
-from plaid.api import plaid_api
-from plaid import configuration, api_client
+import sys
 from plaid.model.link_token_create_request import LinkTokenCreateRequest
 from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
 from plaid.model.link_token_create_request_user_address import LinkTokenCreateRequestUserAddress
@@ -9,32 +7,11 @@ from plaid.model.country_code import CountryCode
 from plaid.model.products import Products
 from plaid.exceptions import ApiException
 
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
 
-# Load environment variables from .env file
-load_dotenv()
-
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-PLAID_ENV = os.getenv("PLAID_ENV", "production")
-
-# Determine the Plaid environment URL
-PLAID_ENV_URLS = {
-    "sandbox": "https://sandbox.plaid.com",
-    "development": "https://development.plaid.com",
-    "production": "https://production.plaid.com"
-}
-PLAID_HOST = PLAID_ENV_URLS.get(PLAID_ENV, "https://production.plaid.com")  # Default to development
-
-# Configure Plaid client
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
+from utils.plaid_client import get_plaid_client
 
 def create_link_token():
     request = LinkTokenCreateRequest(
@@ -46,10 +23,9 @@ def create_link_token():
     )
 
     # print(request)
-    response = client.link_token_create(request)
+    response = get_plaid_client().link_token_create(request)
     return response['link_token']
 
-
 if __name__ == "__main__":
     try:
         link_token = create_link_token()
@@ -1,39 +1,16 @@
 import os
+import sys
 import json
 import logging
-from dotenv import load_dotenv
-from plaid.api import plaid_api
-from plaid import configuration, api_client
 from plaid.api_client import ApiException
 from plaid.model.institutions_search_request import InstitutionsSearchRequest
 from plaid.model.country_code import CountryCode
 
-# Load environment variables
-load_dotenv()
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
 
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-PLAID_ENV = os.getenv("PLAID_ENV", "sandbox")
-
-PLAID_ENV_URLS = {
-    "sandbox": "https://sandbox.plaid.com",
-    "development": "https://development.plaid.com",
-    "production": "https://production.plaid.com"
-}
-PLAID_HOST = PLAID_ENV_URLS.get(PLAID_ENV, "https://sandbox.plaid.com")
-
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+from utils.plaid_client import get_plaid_client
 
 def search_institution(query):
     try:
@@ -41,7 +18,7 @@ def search_institution(query):
             query=query,
             country_codes=[CountryCode('CA')]
         )
-        response = client.institutions_search(request)
+        response = get_plaid_client().institutions_search(request)
         institutions = response['institutions']
         if institutions:
             institution_details = institutions[0].to_dict()
@@ -60,6 +37,7 @@ def search_institution(query):
 
 # Example usage
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     
     institution_name = "Canadian Tire Bank"
     print(f"Searching institution details for: {institution_name}")
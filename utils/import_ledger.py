@@ -0,0 +1,81 @@
+import os
+import hashlib
+import logging
+import threading
+from utils.db import get_db_connection
+
+# In-memory copy of the completed imports in file_import_tracker, loaded once per run, so batch
+# imports decide whether to skip a file without a database round trip. Files are matched by
+# name, and by a BLAKE2 hash of their content against the last import of the same stream (file
+# type and bank), so a re-fetch that returned exactly the same data under a new timestamp is
+# skipped too. Fetches are snapshots: data that changes and then changes back must be imported
+# again, so older imports of the stream are not compared.
+
+def file_stream(file_name):
+    # <prefix>_<bank>_<%Y%m%d%H%M%S>.<ext> without the timestamp and extension
+    return os.path.splitext(file_name)[0].rsplit('_', 1)[0]
+
+def file_content_hash(file_path, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=32)
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ImportLedger:
+    def __init__(self):
+        self.file_names = set()
+        self.latest_hashes = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT file_name, content_hash FROM file_import_tracker WHERE status = 'complete' ORDER BY id")
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+        with self.lock:
+            self.file_names = {file_name for file_name, _ in rows}
+            # Later imports of a stream replace earlier ones
+            self.latest_hashes = {file_stream(file_name): content_hash for file_name, content_hash in rows}
+        logging.info(f"Loaded import ledger: {len(self.file_names)} files, {len(self.latest_hashes)} streams")
+
+    def skip_reason(self, file_name, content_hash=None):
+        with self.lock:
+            if file_name in self.file_names:
+                return "has already been imported"
+            if content_hash and content_hash == self.latest_hashes.get(file_stream(file_name)):
+                return "has the same content as the last file imported for its bank"
+        return None
+
+    def add(self, file_name, content_hash=None):
+        with self.lock:
+            self.file_names.add(file_name)
+            self.latest_hashes[file_stream(file_name)] = content_hash
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+def get_import_ledger():
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                ledger = ImportLedger()
+                ledger.load()
+                _ledger = ledger
+    return _ledger
+
+def check_file(file_path, file_name):
+    # Returns the file's content hash, or None when the file should be skipped
+    content_hash = file_content_hash(file_path)
+    reason = get_import_ledger().skip_reason(file_name, content_hash)
+    if reason:
+        message = f"File {file_name} {reason}. Skipping..."
+        print(message)
+        logging.info(message)
+        return None
+    return content_hash
@@ -0,0 +1,126 @@
+import json
+import time
+import logging
+from itertools import islice
+import mysql.connector
+from utils.db import DEADLOCK_ERRNO
+from utils.settings import get_settings
+
+class InvalidRecord(Exception):
+    # Raised by an importer's validation for a record that is missing fields or has the wrong shape
+    pass
+
+# Errors that come from the record itself: failed validation, or a value the database rejects.
+# A record failing with one of these is quarantined. Anything else, including a KeyError or
+# TypeError from a bug in the importer, stops the import at the last checkpoint.
+RECORD_ERRORS = (InvalidRecord, mysql.connector.errors.DataError, mysql.connector.errors.IntegrityError)
+
+def require_fields(record, fields, kind='record'):
+    if not isinstance(record, dict):
+        raise InvalidRecord(f"{kind} is not an object")
+    missing = [field for field in fields if field not in record]
+    if missing:
+        raise InvalidRecord(f"{kind} is missing {', '.join(missing)}")
+
+def start_file_import(cursor, file_name, description, content_hash=None):
+    # Returns (tracker_id, records_committed) to import from, or None if the file is already complete.
+    # A file left 'in_progress' by an interrupted run resumes after its last committed record.
+    cursor.execute("""
+        SELECT id, status, records_committed FROM file_import_tracker
+        WHERE file_name = %s ORDER BY id DESC LIMIT 1
+    """, (file_name,))
+    row = cursor.fetchone()
+    if row and row[1] != 'in_progress':
+        return None
+    if row:
+        return row[0], row[2]
+
+    cursor.execute("""
+        INSERT INTO file_import_tracker (file_name, description, content_hash, status, records_committed)
+        VALUES (%s, %s, %s, 'in_progress', 0)
+    """, (file_name, description, content_hash))
+    return cursor.lastrowid, 0
+
+def save_checkpoint(cursor, tracker_id, records_committed, status='in_progress'):
+    cursor.execute("""
+        UPDATE file_import_tracker SET records_committed = %s, status = %s WHERE id = %s
+    """, (records_committed, status, tracker_id))
+
+def quarantine_record(cursor, tracker_id, file_name, record_index, record, error):
+    cursor.execute("""
+        INSERT INTO import_quarantine (file_import_id, file_name, record_index, record, error)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (tracker_id, file_name, record_index, json.dumps(record, default=str), str(error)))
+    message = f"Quarantined record {record_index} of {file_name}: {error}"
+    print(message)
+    logging.warning(message)
+
+def add_counts(totals, counts):
+    for key, value in (counts or {}).items():
+        totals[key] = totals.get(key, 0) + value
+
+def apply_chunk(conn, cursor, chunk, index, tracker_id, file_name, process, on_rollback=None):
+    # Writes one chunk in the current transaction and returns its counts. When the chunk fails
+    # because of its data, it is replayed record by record and the bad records are moved to
+    # import_quarantine instead of aborting the file.
+    counts = {'quarantined': 0}
+    try:
+        add_counts(counts, process(cursor, chunk))
+    except RECORD_ERRORS as e:
+        conn.rollback()
+        if on_rollback:
+            on_rollback()
+        logging.warning(f"Chunk at record {index} of {file_name} failed ({e}), retrying record by record")
+        for offset, record in enumerate(chunk):
+            # The savepoint undoes whatever a failing record had already written
+            cursor.execute("SAVEPOINT import_record")
+            try:
+                add_counts(counts, process(cursor, [record]))
+            except RECORD_ERRORS as record_error:
+                cursor.execute("ROLLBACK TO SAVEPOINT import_record")
+                if on_rollback:
+                    on_rollback()
+                quarantine_record(cursor, tracker_id, file_name, index + offset, record, record_error)
+                counts['quarantined'] += 1
+    return counts
+
+def import_in_chunks(conn, cursor, records, tracker_id, file_name, process, start=0, chunk_size=None,
+                     on_commit=None, on_rollback=None):
+    # Applies records in chunks of IMPORT_COMMIT_CHUNK_SIZE, committing each chunk together with the
+    # checkpoint. process(cursor, records) writes a list of records and returns a dict of counts.
+    # A deadlock makes InnoDB roll back the whole transaction, so the chunk is rolled back and
+    # applied again from its first record, up to DB_LOCK_RETRIES times.
+    # on_commit() and on_rollback() are called after each commit and each (savepoint) rollback,
+    # for callers that keep in-memory state about what the transaction wrote.
+    settings = get_settings()
+    chunk_size = chunk_size or settings.import_commit_chunk_size
+    totals = {'quarantined': 0}
+    index = start
+    records = islice(records, start, None)
+
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        attempts = max(1, settings.db_lock_retries)
+        for attempt in range(1, attempts + 1):
+            try:
+                counts = apply_chunk(conn, cursor, chunk, index, tracker_id, file_name, process, on_rollback)
+                save_checkpoint(cursor, tracker_id, index + len(chunk))
+                conn.commit()
+                break
+            except mysql.connector.Error as e:
+                if e.errno != DEADLOCK_ERRNO or attempt >= attempts:
+                    raise
+                conn.rollback()
+                if on_rollback:
+                    on_rollback()
+                logging.warning(f"Deadlock at record {index} of {file_name}, retrying the chunk in "
+                                f"{settings.db_lock_retry_delay} seconds (attempt {attempt}/{attempts})")
+                time.sleep(settings.db_lock_retry_delay)
+        add_counts(totals, counts)
+        index += len(chunk)
+        if on_commit:
+            on_commit()
+
+    return index, totals
@@ -0,0 +1,30 @@
+import ijson
+from ijson import JSONError, ObjectBuilder  # Re-exported for the importers
+
+# Incremental JSON parsing: records are built one at a time while the file is read,
+# so peak memory depends on the largest record rather than on the file size.
+# Numbers are parsed as floats, the same as json.load, so row hashes do not change.
+
+SCALAR_EVENTS = {'string', 'number', 'boolean', 'null'}
+
+def iter_json_items(file_path, prefix='item'):
+    # prefix 'item' walks a top-level array, 'added.item' the array under the 'added' key
+    with open(file_path, 'rb') as file:
+        yield from ijson.items(file, prefix, use_float=True)
+
+def read_json_value(file_path, prefix, default=None):
+    # Returns the first value at prefix, stopping the parse as soon as it is found
+    return next(iter_json_items(file_path, prefix), default)
+
+def read_json_object(file_path, array_keys=(), scalar_keys=()):
+    # A dict shaped like json.load's result for a top-level object, where each array is
+    # a generator that streams its elements from the file when iterated
+    data = {key: iter_json_items(file_path, f'{key}.item') for key in array_keys}
+    for key in scalar_keys:
+        data[key] = read_json_value(file_path, key)
+    return data
+
+def iter_json_events(file_path):
+    # Raw (prefix, event, value) events, for files whose records need their parents' fields
+    with open(file_path, 'rb') as file:
+        yield from ijson.parse(file, use_float=True)
@@ -0,0 +1,84 @@
+import os
+import re
+import sys
+import logging
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.db import get_db_connection
+from utils.settings import setup_logging
+
+# Versioned schema migrations. Each file in data/database/migrations is named
+# <version>_<name>.sql and is applied once, in version order, on top of the tables
+# from create_tables_plaid.sql. Applied versions are recorded in schema_migrations.
+# Version 000 brings databases created from an older create_tables_plaid.sql up to the baseline.
+
+MIGRATIONS_DIR = os.path.join(project_root, 'data', 'database', 'migrations')
+MIGRATION_FILE = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+def list_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for file_name in os.listdir(directory):
+        match = MIGRATION_FILE.match(file_name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, file_name)))
+    return sorted(migrations)
+
+def read_statements(path):
+    # Statements are separated by ';'. Lines starting with '#' or '--' are comments.
+    with open(path, 'r', encoding='utf-8') as file:
+        lines = [line for line in file if not line.lstrip().startswith(('#', '--'))]
+    return [statement.strip() for statement in ''.join(lines).split(';') if statement.strip()]
+
+def ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {version for (version,) in cursor.fetchall()}
+
+def migrate(directory=MIGRATIONS_DIR):
+    # Returns the versions applied by this run. DDL commits implicitly in MySQL, so a migration that
+    # fails part way is not recorded and its remaining statements must be fixed and re-run by hand.
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    applied = []
+    try:
+        ensure_migrations_table(cursor)
+        done = applied_versions(cursor)
+        for version, name, path in list_migrations(directory):
+            if version in done:
+                continue
+            message = f"Applying migration {version:03d}_{name}"
+            print(message)
+            logging.info(message)
+            for statement in read_statements(path):
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            conn.commit()
+            applied.append(version)
+    except Exception as e:
+        conn.rollback()
+        message = f"Migration failed: {e}"
+        print(message)
+        logging.error(message)
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    return applied
+
+if __name__ == "__main__":
+    setup_logging('migrate')
+    applied = migrate()
+    message = f"Applied {len(applied)} migrations" if applied else "Schema is up to date"
+    print(message)
+    logging.info(message)
@@ -0,0 +1,15 @@
+import json
+
+# Newline-delimited JSON: one record per line, so files can be written page by page
+# and read back one record at a time without holding the whole dataset in memory.
+
+def write_ndjson(file, records):
+    for record in records:
+        file.write(json.dumps(record))
+        file.write('\n')
+
+def read_ndjson(file_path):
+    with open(file_path, 'r') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,67 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.settings import get_settings
+
+_institution_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+def get_institution_semaphore(institution, limit):
+    with _semaphores_lock:
+        if institution not in _institution_semaphores:
+            _institution_semaphores[institution] = threading.BoundedSemaphore(limit)
+        return _institution_semaphores[institution]
+
+def run_task(token, product, task, max_per_institution):
+    bank_name = token['bank_name']
+    institution = token.get('bank_id') or bank_name
+    result = {'bank_name': bank_name, 'product': product, 'status': 'ok', 'result': None, 'error': None}
+
+    start = time.monotonic()
+    with get_institution_semaphore(institution, max_per_institution):
+        try:
+            result['result'] = task(token)
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+            message = f"Error running {product} for {bank_name}: {e}"
+            print(message)
+            logging.error(message)
+    result['seconds'] = round(time.monotonic() - start, 2)
+    return result
+
+def run_items(tokens, products, max_workers=None, max_per_institution=None):
+    # Fan out one task per (item, product) pair and collect every result, successful or not.
+    # Keep FETCH_MAX_WORKERS below the MySQL pool size, since each task may hold a pooled connection.
+    max_workers = max_workers or get_settings().fetch_max_workers
+    max_per_institution = max_per_institution or get_settings().fetch_max_per_institution
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(run_task, token, product, task, max_per_institution)
+            for token in tokens
+            for product, task in products.items()
+        ]
+        for future in as_completed(futures):
+            results.append(future.result())
+
+    return results
+
+def summarize_results(results):
+    summary = {}
+    for result in sorted(results, key=lambda r: (r['bank_name'], r['product'])):
+        summary.setdefault(result['bank_name'], {})[result['product']] = result
+
+    lines = []
+    for bank_name, products in summary.items():
+        for product, result in products.items():
+            if result['status'] == 'ok':
+                lines.append(f"{bank_name} {product}: ok in {result['seconds']}s ({result['result']})")
+            else:
+                lines.append(f"{bank_name} {product}: FAILED in {result['seconds']}s - {result['error']}")
+
+    failed = sum(1 for result in results if result['status'] != 'ok')
+    lines.append(f"{len(results) - failed} tasks succeeded, {failed} failed.")
+    return summary, "\n".join(lines)
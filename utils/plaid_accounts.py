@@ -1,76 +1,25 @@
 import os
+import sys
 import json
 import logging
-from dotenv import load_dotenv
-from plaid.api import plaid_api
-from plaid import configuration, api_client
 from plaid.model.accounts_get_request import AccountsGetRequest
 from datetime import datetime
-from urllib.parse import urlparse
-from mysql.connector import pooling
 from decimal import Decimal
 from plaid.api_client import ApiException
 
-# Load environment variables from .env file
-load_dotenv()
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
 
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'plaid_accounts_{today}.log'),
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
-
-# Database connection pool
-MYSQL_URL = os.getenv("MYSQL_URL")
-MYSQL_USER = os.getenv("MYSQL_USER")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
-
-url = urlparse(MYSQL_URL)
-connection_pool = pooling.MySQLConnectionPool(
-    pool_name="mypool",
-    pool_size=5,
-    host=url.hostname,
-    port=url.port if url.port else 3306,
-    user=MYSQL_USER,
-    password=MYSQL_PASSWORD,
-    database=url.path.lstrip('/')
-)
-
-def get_db_connection():
-    return connection_pool.get_connection()
-
-# Plaid configuration
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-PLAID_ENV = os.getenv("PLAID_ENV", "development")
-
-PLAID_ENV_URLS = {
-    "sandbox": "https://sandbox.plaid.com",
-    "development": "https://development.plaid.com",
-    "production": "https://production.plaid.com"
-}
-PLAID_HOST = PLAID_ENV_URLS.get(PLAID_ENV, "https://production.plaid.com")
-
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
+from utils.rate_limiter import call_plaid
+from utils.plaid_client import get_plaid_client
+from utils.db import get_db_connection
+from utils.settings import setup_logging
 
 def fetch_account_info(access_token):
     try:
         request = AccountsGetRequest(access_token=access_token)
-        response = client.accounts_get(request)
+        response = call_plaid('accounts_get', get_plaid_client().accounts_get, request)
         accounts = response['accounts']
         return accounts
     except ApiException as e:
@@ -80,10 +29,10 @@ def fetch_account_info(access_token):
         return None
 
 def store_accounts_in_db(accounts, bank_name):
+    # Raises after rolling back, so callers see the failure
+    conn = get_db_connection()
+    cursor = conn.cursor()
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         for account in accounts:
             account_id = account['account_id']
             available_balance = Decimal(account['balances'].get('available', 0)) if account['balances'].get('available') is not None else None
@@ -123,19 +72,20 @@ def store_accounts_in_db(accounts, bank_name):
             ))
 
         conn.commit()
-        cursor.close()
-        conn.close()
     except Exception as e:
-        if conn:
-            conn.rollback()
+        conn.rollback()
         print(f"Error storing account information in the database: {e}")
         logging.error(f"Error storing account information in the database: {e}")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
 
 def get_access_tokens_from_db():
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT access_token, bank_name, bank_id FROM plaid_access_tokens WHERE bank_name LIKE '%Tangerine%'")
+        cursor.execute("SELECT token_id, access_token, bank_name, bank_id, transactions_cursor FROM plaid_access_tokens WHERE bank_name LIKE '%Tangerine%'")
         tokens = cursor.fetchall()
         cursor.close()
         conn.close()
@@ -146,6 +96,7 @@ def get_access_tokens_from_db():
         return []
 
 if __name__ == "__main__":
+    setup_logging('plaid_accounts')
     print(f"Starting accounts fetch process...")
     logging.info(f"Starting accounts fetch process...")
 
@@ -159,7 +110,10 @@ if __name__ == "__main__":
         if access_token:
             accounts = fetch_account_info(access_token)
             if accounts:
-                store_accounts_in_db(accounts, bank_name)
+                try:
+                    store_accounts_in_db(accounts, bank_name)
+                except Exception:
+                    continue  # Already logged; go on with the next item
 
                 accounts_dict = [account.to_dict() for account in accounts]
                 timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -3,74 +3,20 @@ import sys
 import json
 import logging
 from datetime import datetime
-from urllib.parse import urlparse
-from dotenv import load_dotenv
-from mysql.connector import pooling
-from plaid.api import plaid_api
-from plaid import configuration, api_client
 from plaid.api_client import ApiException
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-# Load environment variables from .env file
-load_dotenv()
-
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-PLAID_ENV = os.getenv("PLAID_ENV", "development")
-
-PLAID_ENV_URLS = {
-    "sandbox": "https://sandbox.plaid.com",
-    "development": "https://development.plaid.com",
-    "production": "https://production.plaid.com"
-}
-PLAID_HOST = PLAID_ENV_URLS.get(PLAID_ENV, "https://production.plaid.com")
-
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
-
-MYSQL_URL = os.getenv("MYSQL_URL")
-MYSQL_USER = os.getenv("MYSQL_USER")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
-
-url = urlparse(MYSQL_URL)
-connection_pool = pooling.MySQLConnectionPool(
-    pool_name="mypool",
-    pool_size=5,
-    host=url.hostname,
-    port=url.port if url.port else 3306,
-    user=MYSQL_USER,
-    password=MYSQL_PASSWORD,
-    database=url.path.lstrip('/')
-)
-
-def get_db_connection():
-    return connection_pool.get_connection()
-
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'plaid_categories_{today}.log'),
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
+from utils.rate_limiter import call_plaid
+from utils.plaid_client import get_plaid_client
+from utils.db import get_db_connection
+from utils.settings import setup_logging
 
 def fetch_categories():
     try:
-        response = client.categories_get({})
+        response = call_plaid('categories_get', get_plaid_client().categories_get, {})
         response_dict = response.to_dict()
         
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -91,6 +37,19 @@ def fetch_categories():
         logging.error(message)
         return []
 
+def link_transaction_categories(cursor):
+    # Sets category_key on transactions imported before their category was in the table
+    linked = 0
+    for table in ('plaid_transactions', 'plaid_transactions_history'):
+        cursor.execute(f"""
+            UPDATE {table} t
+            JOIN categories c ON c.category_id = t.category_id
+            SET t.category_key = c.category_key
+            WHERE t.category_key IS NULL
+        """)
+        linked += cursor.rowcount
+    return linked
+
 def store_categories_in_db(categories):
     try:
         conn = get_db_connection()
@@ -118,7 +77,9 @@ def store_categories_in_db(categories):
                 category_id, category_group, hierarchy_level1, hierarchy_level2, hierarchy_level3
             ))
 
+        linked = link_transaction_categories(cursor)
         conn.commit()
+        logging.info(f"Linked {linked} transactions to their categories")
         cursor.close()
         conn.close()
     except Exception as e:
@@ -128,6 +89,7 @@ def store_categories_in_db(categories):
         logging.error(f"Error storing categories in the database: {e}")
 
 if __name__ == "__main__":
+    setup_logging('plaid_categories')
     print("Starting categories fetch process...")
     logging.info("Starting categories fetch process...")
 
@@ -0,0 +1,48 @@
+import json
+import threading
+from plaid.api import plaid_api
+from plaid import configuration, api_client
+from utils.settings import get_settings
+
+PLAID_ENV_URLS = {
+    "sandbox": "https://sandbox.plaid.com",
+    "development": "https://development.plaid.com",
+    "production": "https://production.plaid.com"
+}
+
+_clients = {}
+_client_lock = threading.Lock()
+
+def get_plaid_client(plaid_env=None):
+    # One PlaidApi per environment and process, created on first use. Every fetcher shares its
+    # urllib3 pool, so concurrent work reuses kept-alive TLS connections instead of opening new ones.
+    settings = get_settings()
+    plaid_env = plaid_env or settings.plaid_env
+    if plaid_env not in _clients:
+        with _client_lock:
+            if plaid_env not in _clients:
+                config = configuration.Configuration(
+                    host=PLAID_ENV_URLS.get(plaid_env, "https://production.plaid.com"),
+                    api_key={
+                        'clientId': settings.plaid_client_id,
+                        'secret': settings.plaid_secret
+                    }
+                )
+                config.connection_pool_maxsize = settings.plaid_pool_size
+
+                client = api_client.ApiClient(config)
+                client.set_default_header('Accept-Encoding', 'gzip')
+                client.set_default_header('Connection', 'keep-alive')
+                _clients[plaid_env] = plaid_api.PlaidApi(client)
+    return _clients[plaid_env]
+
+def use_raw_responses(raw=None):
+    # When enabled, fetchers request the un-deserialized HTTP body (_preload_content=False)
+    # and parse it straight into dicts, skipping plaid-python model construction and to_dict().
+    return get_settings().plaid_raw_responses if raw is None else raw
+
+def raw_json(response):
+    try:
+        return json.loads(response.data)
+    finally:
+        response.release_conn()
@@ -1,38 +1,16 @@
 import os
-from dotenv import load_dotenv
-from plaid.api import plaid_api
-from plaid import configuration, api_client
+import sys
 from plaid.model.item_remove_request import ItemRemoveRequest
 
-# Load environment variables from .env file
-load_dotenv()
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
 
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-PLAID_ENV = os.getenv("PLAID_ENV", "development")  # Set default to development
-
-# Determine the Plaid environment URL
-PLAID_ENV_URLS = {
-    "sandbox": "https://sandbox.plaid.com",
-    "development": "https://development.plaid.com",
-    "production": "https://production.plaid.com"
-}
-PLAID_HOST = PLAID_ENV_URLS.get(PLAID_ENV, "https://development.plaid.com")  # Default to development
-
-# Configure Plaid client
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
+from utils.plaid_client import get_plaid_client
 
 def remove_item(access_token):
     request = ItemRemoveRequest(access_token=access_token)
-    response = client.item_remove(request)
+    response = get_plaid_client().item_remove(request)
     return response
 
 if __name__ == "__main__":
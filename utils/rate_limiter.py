@@ -0,0 +1,128 @@
+import json
+import logging
+import random
+import threading
+import time
+from plaid.api_client import ApiException
+from utils.settings import get_settings
+
+# Request budget per Plaid endpoint and item, in requests per minute, following Plaid's per-item
+# limits: items fetched concurrently each get their own budget. Requests that are not for an item
+# (no access_token) share one budget per endpoint. Endpoints not listed here use the
+# PLAID_DEFAULT_RATE_PER_MINUTE setting. PLAID_CLIENT_RATE_PER_MINUTE, when set, adds one budget
+# per endpoint shared by every item, for the client-wide limits.
+ENDPOINT_RATES = {
+    'transactions_get': 30,
+    'transactions_sync': 50,
+    'transactions_recurring_get': 20,
+    'transactions_enrich': 100,
+    'liabilities_get': 15,
+    'accounts_get': 15,
+    'investments_holdings_get': 15,
+    'investments_transactions_get': 30,
+    'asset_report_create': 10,
+    'asset_report_get': 30,
+    'categories_get': 10,
+}
+
+# Initial backoff in seconds by Plaid error_code / error_type. Anything not listed is not retried.
+BACKOFF_BASE_SECONDS = {
+    'RATE_LIMIT_EXCEEDED': 2,
+    'PRODUCT_NOT_READY': 10,
+    'INTERNAL_SERVER_ERROR': 1,
+    'PLANNED_MAINTENANCE': 10,
+    'INSTITUTION_DOWN': 5,
+    'INSTITUTION_NOT_RESPONDING': 5,
+    'API_ERROR': 1,
+}
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1, rate_per_minute // 6)  # Allow roughly a 10 second burst
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+_buckets = {}
+_client_buckets = {}
+_buckets_lock = threading.Lock()
+
+def request_item(args):
+    # Plaid requests identify their item by access_token
+    request = args[0] if args else None
+    if isinstance(request, dict):
+        return request.get('access_token')
+    return getattr(request, 'access_token', None)
+
+def get_bucket(endpoint, item=None):
+    with _buckets_lock:
+        if (endpoint, item) not in _buckets:
+            rate = ENDPOINT_RATES.get(endpoint, get_settings().plaid_default_rate_per_minute)
+            _buckets[(endpoint, item)] = TokenBucket(rate)
+        return _buckets[(endpoint, item)]
+
+def get_client_bucket(endpoint):
+    # None when PLAID_CLIENT_RATE_PER_MINUTE is 0 (no client-wide budget)
+    rate = get_settings().plaid_client_rate_per_minute
+    if not rate:
+        return None
+    with _buckets_lock:
+        if endpoint not in _client_buckets:
+            _client_buckets[endpoint] = TokenBucket(rate)
+        return _client_buckets[endpoint]
+
+def parse_plaid_error(e):
+    try:
+        return json.loads(e.body) if e.body else {}
+    except (TypeError, ValueError):
+        return {}
+
+def get_backoff_base(error_response):
+    error_code = error_response.get('error_code')
+    if error_code in BACKOFF_BASE_SECONDS:
+        return BACKOFF_BASE_SECONDS[error_code]
+    return BACKOFF_BASE_SECONDS.get(error_response.get('error_type'))
+
+def backoff_delay(base, attempt):
+    # Exponential backoff with equal jitter: half the delay is fixed, half is random
+    delay = min(get_settings().plaid_backoff_cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def call_plaid(endpoint, func, *args, max_retries=None, **kwargs):
+    max_retries = get_settings().plaid_max_retries if max_retries is None else max_retries
+    bucket = get_bucket(endpoint, request_item(args))
+    client_bucket = get_client_bucket(endpoint)
+
+    attempt = 0
+    while True:
+        bucket.acquire()
+        if client_bucket:
+            client_bucket.acquire()
+        try:
+            return func(*args, **kwargs)
+        except ApiException as e:
+            error_response = parse_plaid_error(e)
+            base = get_backoff_base(error_response)
+            if base is None or attempt >= max_retries:
+                raise
+
+            delay = backoff_delay(base, attempt)
+            attempt += 1
+            message = (f"{endpoint} returned {error_response.get('error_code')}, "
+                       f"retrying in {delay:.1f} seconds (attempt {attempt}/{max_retries})...")
+            print(message)
+            logging.info(message)
+            time.sleep(delay)
@@ -3,55 +3,21 @@ import os
 import sys
 import json
 import logging
-from dotenv import load_dotenv
-from plaid.api import plaid_api
-from plaid import configuration, api_client
-from datetime import datetime
 
 from plaid.api_client import ApiException
 from plaid.model.asset_report_remove_request import AssetReportRemoveRequest
 
-# Load environment variables from .env file
-load_dotenv()
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
 
-PLAID_CLIENT_ID = os.getenv("PLAID_CLIENT_ID")
-PLAID_SECRET = os.getenv("PLAID_SECRET")
-PLAID_ENV = os.getenv("PLAID_ENV", "development")
-
-PLAID_ENV_URLS = {
-    "sandbox": "https://sandbox.plaid.com",
-    "development": "https://development.plaid.com",
-    "production": "https://production.plaid.com"
-}
-PLAID_HOST = PLAID_ENV_URLS.get(PLAID_ENV, "https://production.plaid.com")
-
-configuration = configuration.Configuration(
-    host=PLAID_HOST,
-    api_key={
-        'clientId': PLAID_CLIENT_ID,
-        'secret': PLAID_SECRET
-    }
-)
-api_client = api_client.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
-
-
-# Set up logging
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-today = datetime.now().strftime('%Y-%m-%d')
-logging.basicConfig(
-    filename=os.path.join(log_dir, f'remove_asset_reports_{today}.log'),
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
+from utils.plaid_client import get_plaid_client
+from utils.settings import setup_logging
 
 def remove_asset_report(asset_report_token):
     try:
         request = AssetReportRemoveRequest(asset_report_token=asset_report_token)
-        response = client.asset_report_remove(request)
+        response = get_plaid_client().asset_report_remove(request)
         
         message = f"Asset report with token {asset_report_token} removed successfully."
         print(message)
@@ -65,6 +31,7 @@ def remove_asset_report(asset_report_token):
         return False
 
 if __name__ == "__main__":
+    setup_logging('remove_asset_reports')
     # List of asset reports to remove
     asset_reports = [
         "c2c1373b-6c9e-41ad-9543-181a3ea1fa80",
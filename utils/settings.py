@@ -0,0 +1,94 @@
+import os
+import logging
+import threading
+from datetime import datetime
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+class Settings:
+    # Everything read from the environment lives here. Nothing is read until the first
+    # get_settings() call, so importing a module never touches .env, MySQL or Plaid.
+    def __init__(self):
+        load_dotenv()
+
+        # Plaid
+        self.plaid_client_id = os.getenv("PLAID_CLIENT_ID")
+        self.plaid_secret = os.getenv("PLAID_SECRET")
+        self.plaid_env = os.getenv("PLAID_ENV", "development")
+        self.plaid_pool_size = int(os.getenv("PLAID_POOL_SIZE", 16))
+        self.plaid_raw_responses = os.getenv("PLAID_RAW_RESPONSES", "false").lower() == "true"
+        self.plaid_max_retries = int(os.getenv("PLAID_MAX_RETRIES", 5))
+        self.plaid_backoff_cap = float(os.getenv("PLAID_BACKOFF_CAP", 60))
+        self.plaid_default_rate_per_minute = int(os.getenv("PLAID_DEFAULT_RATE_PER_MINUTE", 60))
+        self.plaid_client_rate_per_minute = int(os.getenv("PLAID_CLIENT_RATE_PER_MINUTE", 0))
+
+        # Fetching
+        self.plaid_transactions_mode = os.getenv("PLAID_TRANSACTIONS_MODE", "sync")  # 'sync', 'get' or 'backfill'
+        self.plaid_output_format = os.getenv("PLAID_OUTPUT_FORMAT", "json")  # 'json' or 'ndjson'
+        self.backfill_max_workers = int(os.getenv("BACKFILL_MAX_WORKERS", 4))
+        self.fetch_max_workers = int(os.getenv("FETCH_MAX_WORKERS", 4))
+        self.fetch_max_per_institution = int(os.getenv("FETCH_MAX_PER_INSTITUTION", 2))
+
+        # MySQL
+        mysql_url = urlparse(os.getenv("MYSQL_URL", ""))
+        self.mysql_host = mysql_url.hostname
+        self.mysql_port = mysql_url.port if mysql_url.port else 3306
+        self.mysql_user = os.getenv("MYSQL_USER")
+        self.mysql_password = os.getenv("MYSQL_PASSWORD")
+        self.mysql_database = mysql_url.path.lstrip('/')
+        self.db_pool_size = int(os.getenv("DB_POOL_SIZE", 5))
+        self.db_pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", 30))  # Seconds to wait for a free connection
+        self.db_lock_wait_timeout = int(os.getenv("DB_LOCK_WAIT_TIMEOUT", 120))  # Session innodb_lock_wait_timeout
+        self.db_reconnect_attempts = int(os.getenv("DB_RECONNECT_ATTEMPTS", 3))
+        self.db_reconnect_delay = float(os.getenv("DB_RECONNECT_DELAY", 2))
+        self.db_lock_retries = int(os.getenv("DB_LOCK_RETRIES", 3))  # Attempts per statement on lock wait timeouts
+        self.db_lock_retry_delay = float(os.getenv("DB_LOCK_RETRY_DELAY", 5))
+
+        # Importing
+        self.import_batch_size = int(os.getenv("IMPORT_BATCH_SIZE", 1000))  # Rows per multi-row INSERT
+        self.import_bulk_load = os.getenv("IMPORT_BULK_LOAD", "false").lower() == "true"  # LOAD DATA LOCAL INFILE
+        self.bulk_load_batch_size = int(os.getenv("BULK_LOAD_BATCH_SIZE", 100000))  # Rows per LOAD DATA file
+        self.import_commit_chunk_size = int(os.getenv("IMPORT_COMMIT_CHUNK_SIZE", 5000))  # Records per commit and checkpoint
+        self.import_max_workers = int(os.getenv("IMPORT_MAX_WORKERS", 4))  # Banks imported concurrently
+        self.import_prepared_statements = os.getenv("IMPORT_PREPARED_STATEMENTS", "true").lower() == "true"  # Server-side prepared statements
+        self.pending_stale_days = int(os.getenv("PENDING_STALE_DAYS", 30))  # Pending transactions older than this are archived; 0 keeps them
+        self.history_retention_months = int(os.getenv("HISTORY_RETENTION_MONTHS", 0))  # History partitions kept by compact_history; 0 keeps all
+        self.history_mode = os.getenv("HISTORY_MODE", "copy")  # 'copy' (delete and re-insert changed rows) or 'scd2' (update in place)
+
+        # Logging
+        self.log_dir = os.getenv("LOG_DIR", "logs")
+
+    @property
+    def mysql_config(self):
+        return {
+            "host": self.mysql_host,
+            "port": self.mysql_port,
+            "user": self.mysql_user,
+            "password": self.mysql_password,
+            "database": self.mysql_database,
+            "allow_local_infile": self.import_bulk_load
+        }
+
+_settings = None
+_settings_lock = threading.Lock()
+
+def get_settings():
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = Settings()
+    return _settings
+
+def setup_logging(log_name, level=logging.INFO):
+    # Called from entry points only; basicConfig is a no-op once the root logger has a handler
+    log_dir = get_settings().log_dir
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    today = datetime.now().strftime('%Y-%m-%d')
+    logging.basicConfig(
+        filename=os.path.join(log_dir, f'{log_name}_{today}.log'),
+        level=level,
+        format='%(asctime)s %(levelname)s:%(message)s'
+    )